@@ -4,6 +4,26 @@ import sys
 import numpy as np
 from enum import Enum
 
+from MaxTree import MaxTree, SMALL_TREE
+from Problem import Dist
+from SumTree import SoftmaxTree
+
+# relative growth of the UCB exploration scale after which all UCB scores are recomputed
+UCB_TOLERANCE = 0.01
+
+# discounted counts of DISCOUNTED_UCB are rescaled once the lazy discount factor exceeds this value
+DISCOUNT_LIMIT = 1e100
+
+# Thompson sampling on Gaussian arms: known reward standard deviation (as generated by Problem) and Normal prior of
+# the mean of every arm
+THOMPSON_STDEV = 0.2
+THOMPSON_PRIOR_MEAN = 0.5
+THOMPSON_PRIOR_STDEV = 1
+
+# empty history of new agents, shared by all of them until run() allocates their own buffers
+NO_HISTORY = np.zeros(0, dtype=np.float32)
+NO_HISTORY.flags.writeable = False
+
 
 class Mode(Enum):
     """
@@ -15,30 +35,29 @@ class Mode(Enum):
     SOFTMAX = 3
     UCB = 4
     ACTION_PREFERENCES = 5
+    THOMPSON = 6
+    DISCOUNTED_UCB = 7
+    SW_UCB = 8
 
 
-def categorical_draw(pi):
+def log_checkpoints(horizon, num=50):
     """
-    Arm selection based on pi probability. Algorithm taken from
-    https://medium.com/analytics-vidhya/multi-armed-bandit-analysis-of-softmax-algorithm-e1fa4cb0c422
-    :param pi:
-    :return:
+    Log-spaced checkpoints for long runs
+    :param horizon: Total number of steps
+    :param num: Max number of checkpoints
+    :returns sorted list of step counts, ending with the horizon
     """
-    z = random.random()
-    cum_prob = 0.0
-
-    # return the randomly selected arm
-    for i in range(len(pi)):
-        prob = pi[i]
-        cum_prob += prob
-
-        if cum_prob > z:
-            return i
-    return len(pi) - 1
+    return sorted(set(np.geomspace(1, horizon, num=num).astype(int).tolist()) | {horizon})
 
 
 class Agent:
-    def __init__(self, env, mode=Mode.GREEDY, epsilon=0.38, ucb_c=0.38, alpha=0.9, tau=0.12):
+    __slots__ = ('env', 'mode', 'rng', 'probe', 'start_step', 'step', 'average_rewards', 'accuracy', 'total_reward',
+                 'counter_selected_best', 'estimations', 'uncertainties', 'H', 'policy', 'index', 'ucb_scale',
+                 'posterior', 'sampler', 'counts', 'sums', 'discount', 'window_arms', 'window_rewards', 'epsilon',
+                 'ucb_c', 'alpha', 'tau', 'gamma', 'window', 'step_size')
+
+    def __init__(self, env, mode=Mode.GREEDY, epsilon=0.38, ucb_c=0.38, alpha=0.9, tau=0.12, gamma=0.99, window=100,
+                 step_size=None, rng=None):
         """
         Agent that solves the multi armed bandit problem
         :param env: the multi-armed bandit
@@ -47,60 +66,177 @@ class Agent:
         :param ucb_c: c hyperparameter for UCB
         :param alpha: alpha hyperparameter for action preference
         :param tau: hyperparameter for softmax
+        :param gamma: discount factor for discounted UCB
+        :param window: number of most recent steps used by sliding-window UCB
+        :param step_size: constant step size of the estimations for non-stationary problems (None for the sample
+        average 1 / t)
+        :param rng: source of random numbers with the interface of the random module (the random module by default)
         """
 
         self.env = env
         self.mode = mode
+        self.rng = rng if rng is not None else random
+
+        # optional Probe that times the phases of every step
+        self.probe = None
 
         # time step, starts at 3 for UCB to avoid subunitary ln
-        self.step = 3 if mode == Mode.UCB else 1
-        self.average_rewards = []
-        self.accuracy = []
+        self.start_step = 3 if mode == Mode.UCB else 1
+        self.step = self.start_step
+        # float32 history buffers, allocated by run() for all its steps and written by index
+        self.average_rewards = NO_HISTORY
+        self.accuracy = NO_HISTORY
+        self.total_reward = 0
+        self.counter_selected_best = 0
 
         # Qt(a) given values in a later function
         self.estimations = None
 
-        # Na(t) starts at 1 to avoid division by 0 in UCB
-        self.uncertainties = [1] * env.arms
+        # Na(t) starts at 1 to avoid division by 0 in UCB, only kept for UCB
+        self.uncertainties = np.ones(env.arms, dtype=np.int64) if mode == Mode.UCB else None
+
+        # Ht(a) initialized to equal complementary probabilities, only kept for action preferences
+        self.H = np.full(env.arms, 1 / env.arms) if mode == Mode.ACTION_PREFERENCES else None
 
-        # Ht(a) and PIt(a) initialized to equal complementary probabilities
-        self.H = [1 / env.arms] * env.arms
-        self.pi = [1 / env.arms] * env.arms
+        # PIt(a) as a softmax over Qt(a) / tau or Ht(a), sampled in O(log k)
+        self.policy = None
+
+        # best arms by Qt(a) for the greedy modes and by UCB score for UCB, found in O(log k)
+        self.index = None
+        self.ucb_scale = 0  # exploration scale c * sqrt(ln t) with which the UCB scores in the index were computed
+
+        # conjugate posterior per arm for Thompson sampling: Beta (alpha, beta) for Bernoulli rewards, Normal
+        # (mean, precision) for Gaussian rewards. All k samples of a step are drawn at once from a numpy Generator
+        # seeded from rng.
+        self.posterior = None
+        self.sampler = None
+
+        # reward statistics per arm for the non-stationary UCB modes. DISCOUNTED_UCB keeps the discounted counts and
+        # reward sums multiplied by the factor discount = gamma^-t, so only the pulled arm changes per step.
+        # SW_UCB keeps the counts and sums over the last window steps, whose arms and rewards are kept in a ring
+        # buffer, so the step that leaves the window is subtracted in O(1).
+        self.counts = None
+        self.sums = None
+        self.discount = 1
+        self.window_arms = None
+        self.window_rewards = None
 
         # hyperparameters:
         self.epsilon = epsilon
         self.ucb_c = ucb_c
         self.alpha = alpha
         self.tau = tau
+        self.gamma = gamma
+        self.window = window
+        self.step_size = step_size
 
         self.initialize_estimations()
+        if mode == Mode.SOFTMAX:
+            self.policy = SoftmaxTree((self.estimations / tau).tolist())
+        elif mode == Mode.ACTION_PREFERENCES:
+            self.policy = SoftmaxTree(self.H.tolist())
+        elif mode == Mode.UCB:
+            self.refresh_ucb_scores()
+        elif mode == Mode.THOMPSON:
+            self.initialize_posterior()
+            self.sampler = np.random.default_rng(self.rng.getrandbits(64))
+        elif mode == Mode.DISCOUNTED_UCB or mode == Mode.SW_UCB:
+            self.counts = np.zeros(env.arms)
+            self.sums = np.zeros(env.arms)
+            if mode == Mode.SW_UCB:
+                self.window_arms = np.zeros(window, dtype=np.int64)
+                self.window_rewards = np.zeros(window)
+        else:
+            self.index = MaxTree(self.estimations.tolist())
+
+    @property
+    def pi(self):
+        """
+        PIt(a) of every arm, uniform for modes without a softmax policy
+        """
+        if self.policy is None:
+            return np.full(self.env.arms, 1 / self.env.arms)
+        return np.array(self.policy.probabilities())
 
     def run(self, verbose=False, max_steps=1000):
         """
         :param verbose: Prints verbose code
         :param max_steps: Max number of epochs
-        Runs the agent on the problem.
+        Runs the agent on the problem. If a Probe is attached, the instrumented loop of the probe is used instead.
         """
-        total_reward = 0
-        counter_selected_best = 0
+        if self.probe is not None:
+            self.probe.run(self, max_steps)
+            return
+
+        self.reserve(max_steps)
         max_steps += self.step  # adjust for initial step value
         for self.step in range(self.step, max_steps):
             arm, reward, is_best = self.choose_action()
-            total_reward += reward
-            counter_selected_best += is_best
-            self.average_rewards.append(round(total_reward / self.step, 3))
-            self.accuracy.append(round(counter_selected_best / self.step, 3))
+            self.record(reward, is_best)
             # update parameters
             self.update_parameters(arm, reward)
             if verbose:
                 print("Step:", self.step, "; Pulling arm", arm, "; Reward:", round(reward, 3),
-                      "; current average reward:", round(total_reward / self.step, 3))
+                      "; current average reward:", round(self.total_reward / self.step, 3))
+        self.step = max_steps
         # print("Process complete!")
 
+    def iter_run(self, horizon, checkpoints=None):
+        """
+        Runs the agent on the problem without keeping a history, so memory does not grow with the horizon. Horizon
+        and checkpoints count all steps the agent played, so after restoring a checkpoint the same call continues
+        where the saved run stopped.
+        :param horizon: Total number of steps to play
+        :param checkpoints: Numbers of played steps at which a snapshot is yielded, e.g. log_checkpoints(horizon). The
+        horizon is always one of them.
+        :returns generator of (played steps, average reward, accuracy) snapshots
+        """
+        played = self.step - self.start_step
+        checkpoints = [c for c in sorted(set(checkpoints or []) | {horizon}) if played < c <= horizon]
+        for checkpoint in checkpoints:
+            for self.step in range(self.step, self.start_step + checkpoint):
+                arm, reward, is_best = self.choose_action()
+                self.total_reward += reward
+                self.counter_selected_best += is_best
+                self.update_parameters(arm, reward)
+            self.step += 1
+            yield checkpoint, self.total_reward / (self.step - 1), self.counter_selected_best / (self.step - 1)
+
+    def reserve(self, steps):
+        """
+        Grows the history buffers so that the next steps can be recorded without allocating
+        :param steps: Number of steps that will be recorded
+        """
+        size = self.step - self.start_step + steps
+        if size > len(self.average_rewards):
+            self.average_rewards = np.resize(self.average_rewards, size)
+            self.accuracy = np.resize(self.accuracy, size)
+
+    def record(self, reward, is_best):
+        """
+        Writes the outcome of the current step to the average reward and accuracy history
+        :param reward: obtained reward
+        :param is_best: 1 if the best action was selected, otherwise 0
+        """
+        self.total_reward += reward
+        self.counter_selected_best += is_best
+        played = self.step - self.start_step
+        self.average_rewards[played] = self.total_reward / self.step
+        self.accuracy[played] = self.counter_selected_best / self.step
+
     def choose_action(self):
+        """
+        Selects an action and pulls its arm.
+        :returns the selected arm, the resultant reward and whether it is the best arm
+        """
+        selected_arm = self.select_action()
+        reward, is_best = self.env.pull_arm(selected_arm)
+        return selected_arm, reward, is_best
+
+    def select_action(self):
         """
         Calls appropriate action selection method based on mode.
-        :returns the selected arm and the resultant reward
+        :returns the selected arm
         """
         match self.mode:
             case Mode.GREEDY:
@@ -116,10 +252,13 @@ class Agent:
                 selected_arm = self.ucb()
             case Mode.ACTION_PREFERENCES:
                 selected_arm = self.action_pref()
+            case Mode.THOMPSON:
+                selected_arm = self.thompson()
+            case Mode.DISCOUNTED_UCB | Mode.SW_UCB:
+                selected_arm = self.windowed_ucb()
             case _:
                 sys.exit("Invalid selection mode selected!")
-        reward, is_best = self.env.pull_arm(selected_arm)
-        return selected_arm, reward, is_best
+        return selected_arm
 
     def greedy(self):
         """
@@ -127,62 +266,59 @@ class Agent:
         chosen.
         :returns selected action
         """
-        # best_actions = [random.randint(0,self.env.arms - 1)]
-        # best_reward = self.estimations[best_actions[0]]
-        best_actions = [0]
-        best_reward = self.estimations[best_actions[0]]
-
-        for arm in range(self.env.arms):
-            reward = self.estimations[arm]
-            if reward > best_reward:  # new highest utility arm
-                best_actions = [arm]
-                best_reward = reward
-            elif reward == best_reward:  # arm with same highest utility
-                best_actions.append(arm)
-
-        return random.choice(best_actions)
+        return self.index.best(self.rng.random())
 
     def epsilon_greedy(self):
         """
         Selects action for epsilon greedy algorithm
         :returns selected action
         """
-        eps_action = random.uniform(0, 1)
+        eps_action = self.rng.uniform(0, 1)
         if eps_action > self.epsilon:
             return self.greedy()
         else:
-            return random.randint(0, self.env.arms - 1)
+            return self.rng.randint(0, self.env.arms - 1)
 
     def ucb(self):
         """
-        Selects action for UCB algorithm
+        Selects action for UCB algorithm. Scores are compared at one decimal. The exploration bonus of every arm
+        grows with ln t, so the scores of all arms are only recomputed once c * sqrt(ln t) has grown by more than
+        UCB_TOLERANCE since the last time; in between the score of the selected arm is updated after every step.
         :returns selected action
         """
+        if self.ucb_c * math.sqrt(math.log(self.step)) > self.ucb_scale * (1 + UCB_TOLERANCE):
+            self.refresh_ucb_scores()
 
-        # initialize starting values
-        rand_arm = random.randint(0, self.env.arms - 1)
-        best_reward = self.estimations[rand_arm] + self.ucb_c * math.sqrt(
-            np.log(self.step) / self.uncertainties[rand_arm])
-        best_actions = [rand_arm]
+        # randomly return one of the highest-reward actions
+        return self.index.best(self.rng.random())
 
-        # iterate to find actions with highest rewards
-        for arm in range(self.env.arms):
-            reward = self.estimations[arm] + self.ucb_c * math.sqrt(np.log(self.step) / self.uncertainties[arm])
-            if round(reward, 1) > round(best_reward, 1):
-                best_actions = [arm]
-                best_reward = reward
-            elif round(reward, 1) == round(best_reward, 1):
-                best_actions.append(arm)
+    def ucb_score(self, arm):
+        """
+        :param arm: Arm
+        :returns UCB score of the arm at the current exploration scale, rounded to one decimal
+        """
+        return round(float(self.estimations[arm]) + self.ucb_scale / math.sqrt(self.uncertainties[arm]), 1)
 
-        # randomly return one of the highest-reward actions
-        return random.choice(best_actions)
+    def refresh_ucb_scores(self):
+        """
+        Recomputes the UCB scores of all arms for the current time step
+        """
+        self.ucb_scale = self.ucb_c * math.sqrt(math.log(self.step))
+        if self.env.arms <= SMALL_TREE:
+            scores = [self.ucb_score(arm) for arm in range(self.env.arms)]
+        else:
+            scores = np.round(self.estimations + self.ucb_scale / np.sqrt(self.uncertainties), 1)
+        if self.index is None:
+            self.index = MaxTree(scores)
+        else:
+            self.index.rebuild(scores)
 
     def softmax(self):
         """
         Selects action for softmax algorithm
         :returns selected action
         """
-        best_action = categorical_draw(self.pi)
+        best_action = self.policy.sample(self.rng.random())
         return best_action
 
     def action_pref(self):
@@ -190,9 +326,38 @@ class Agent:
         Selects action for action preference algorithm
         :returns selected action
         """
-        best_action = categorical_draw(self.pi)
+        best_action = self.policy.sample(self.rng.random())
         return best_action
 
+    def thompson(self):
+        """
+        Selects action for Thompson sampling: draws one mean per arm from its posterior and picks the highest
+        :returns selected action
+        """
+        if self.env.dist_type == Dist.BERNOULLI:
+            samples = self.sampler.beta(self.posterior[0], self.posterior[1])
+        else:
+            samples = self.sampler.normal(self.posterior[0], 1 / np.sqrt(self.posterior[1]))
+        return int(np.argmax(samples))
+
+    def windowed_ucb(self):
+        """
+        Selects action for discounted UCB and sliding-window UCB: highest mean + c * sqrt(ln n / N(a)) over the
+        discounted or windowed counts N(a) and their total n. Arms without recent pulls are selected first.
+        :returns selected action
+        """
+        if self.mode == Mode.DISCOUNTED_UCB:
+            counts = self.counts / self.discount
+            total = counts.sum()
+        else:
+            counts = self.counts
+            total = min(self.step - self.start_step, self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = self.sums / self.counts + self.ucb_c * np.sqrt(math.log(max(total, 1)) / counts)
+        scores[counts <= 0] = math.inf
+        best = np.flatnonzero(scores == scores.max())
+        return int(best[int(self.rng.random() * len(best))])
+
     def update_parameters(self, arm, reward):
         """
         Calls appropriate methods for parameter updating, depending on selected algorithm
@@ -208,25 +373,50 @@ class Agent:
             case Mode.ACTION_PREFERENCES:
                 self.update_preferences(arm, reward)
                 self.update_pi(arm)
+            case Mode.THOMPSON:
+                self.update_posterior(arm, reward)
+            case Mode.DISCOUNTED_UCB:
+                self.update_discounted(arm, reward)
+            case Mode.SW_UCB:
+                self.update_window(arm, reward)
 
     def initialize_estimations(self):
         """
         Initializes the estimations either optimistically or at a fixed value
         """
         if self.mode == Mode.OPTIMISTIC or self.mode == Mode.UCB:  # initialize values as more than max possible reward
-            self.estimations = [1] * self.env.arms
+            self.estimations = np.ones(self.env.arms)
         else:  # initialize values at a specific value
-            self.estimations = [0] * self.env.arms
+            self.estimations = np.zeros(self.env.arms)
+
+    def initialize_posterior(self):
+        """
+        Initializes the posteriors of all arms to the prior: uniform Beta(1, 1) for Bernoulli rewards and
+        N(THOMPSON_PRIOR_MEAN, THOMPSON_PRIOR_STDEV^2) for Gaussian rewards
+        """
+        if self.env.dist_type == Dist.BERNOULLI:
+            self.posterior = np.ones((2, self.env.arms))
+        else:
+            self.posterior = np.empty((2, self.env.arms))
+            self.posterior[0] = THOMPSON_PRIOR_MEAN
+            self.posterior[1] = 1 / THOMPSON_PRIOR_STDEV ** 2
 
     def update_estimations(self, arm, reward):
         """
-        incremental sample-average update. updates the utility estimate of the selected arm based on the resultant
-        reward
+        incremental sample-average update, or exponential recency-weighted average if a constant step_size is set.
+        updates the utility estimate of the selected arm based on the resultant reward
         :param arm: Selected arm
         :param reward: Resultant reward
         """
         if self.step > 0:
-            self.estimations[arm] += (reward - self.estimations[arm]) / self.step
+            estimation = float(self.estimations[arm])
+            if self.step_size is None:
+                estimation += (reward - estimation) / self.step
+            else:
+                estimation += self.step_size * (reward - estimation)
+            self.estimations[arm] = estimation
+            if self.mode != Mode.UCB and self.index is not None:
+                self.index.update(arm, estimation)
 
     def update_uncertainties(self, selected_arm):
         """
@@ -234,6 +424,54 @@ class Agent:
         :param selected_arm: Selected arm
         """
         self.uncertainties[selected_arm] += 1
+        self.index.update(selected_arm, self.ucb_score(selected_arm))
+
+    def update_posterior(self, arm, reward):
+        """
+        Conjugate update of the posterior of the selected arm
+        :param arm: Selected arm
+        :param reward: Resultant reward
+        """
+        if self.env.dist_type == Dist.BERNOULLI:
+            self.posterior[0, arm] += reward
+            self.posterior[1, arm] += 1 - reward
+        else:
+            mean, precision = self.posterior[:, arm]
+            updated = precision + 1 / THOMPSON_STDEV ** 2
+            self.posterior[0, arm] = (mean * precision + reward / THOMPSON_STDEV ** 2) / updated
+            self.posterior[1, arm] = updated
+
+    def update_discounted(self, arm, reward):
+        """
+        Discounts all counts and sums by gamma and adds the reward of the selected arm. Instead of multiplying every
+        arm by gamma, the weight of new observations grows by 1 / gamma per step.
+        :param arm: Selected arm
+        :param reward: Resultant reward
+        """
+        self.discount /= self.gamma
+        if self.discount > DISCOUNT_LIMIT:
+            self.counts /= self.discount
+            self.sums /= self.discount
+            self.discount = 1
+        self.counts[arm] += self.discount
+        self.sums[arm] += self.discount * reward
+
+    def update_window(self, arm, reward):
+        """
+        Adds the reward of the selected arm to the window and removes the step that falls out of it
+        :param arm: Selected arm
+        :param reward: Resultant reward
+        """
+        played = self.step - self.start_step
+        position = played % self.window
+        if played >= self.window:
+            old = self.window_arms[position]
+            self.counts[old] -= 1
+            self.sums[old] -= self.window_rewards[position]
+        self.window_arms[position] = arm
+        self.window_rewards[position] = reward
+        self.counts[arm] += 1
+        self.sums[arm] += reward
 
     def update_preferences(self, selected_arm, reward):
         """
@@ -241,26 +479,18 @@ class Agent:
         :param reward: Reward from selected action
         :param selected_arm: Selected arm
         """
-        for arm in range(self.env.arms):
-            regret = (reward - self.average_rewards[-1])
-            if arm == selected_arm:
-                self.H[arm] += self.alpha * regret * (1 - self.pi[arm])
-            else:
-                self.H[arm] -= self.alpha * regret * self.pi[arm]
+        pi = self.pi
+        regret = (reward - self.total_reward / self.step)
+        update = -self.alpha * regret * pi
+        update[selected_arm] = self.alpha * regret * (1 - pi[selected_arm])
+        self.H += update
 
     def update_pi(self, selected_arm):
         """
         Updates the pi value of all arms for softmax/action preferences
         :param selected_arm: Selected arm
         """
-        total = 0
-        for arm in range(self.env.arms):
-            if self.mode == Mode.SOFTMAX:  # if softmax algorithm
-                total += math.exp(self.estimations[arm] / self.tau)
-            else:  # if action preferences
-                total += math.exp(self.H[arm])
-
-        if self.mode == Mode.SOFTMAX:  # if softmax algorithm
-            self.pi[selected_arm] = math.exp(self.estimations[selected_arm] / self.tau) / total
-        else:  # if action preferences algorithm
-            self.pi[selected_arm] = math.exp(self.H[selected_arm]) / total
+        if self.mode == Mode.SOFTMAX:  # if softmax algorithm, only the estimation of the selected arm changed
+            self.policy.update(selected_arm, float(self.estimations[selected_arm]) / self.tau)
+        else:  # if action preferences algorithm, all preferences changed
+            self.policy.rebuild(self.H.tolist())
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class Aggregator:
+    def __init__(self, shape):
+        """
+        Streaming mean and variance of curves over replicas (Welford's algorithm). Memory only depends on the shape
+        of one curve, not on the number of replicas folded in.
+        :param shape: shape of one curve, e.g. the number of time steps
+        """
+        self.count = 0  # number of replicas folded in
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # sum of squared differences from the mean
+
+    def add(self, values):
+        """
+        Folds in the curve of one replica
+        :param values: curve of the replica
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def add_batch(self, values):
+        """
+        Folds in the curves of a batch of replicas
+        :param values: (n, ...) array with one curve per replica
+        """
+        values = np.asarray(values, dtype=float)
+        mean = values.mean(axis=0)
+        self.merge_moments(len(values), mean, np.square(values - mean).sum(axis=0))
+
+    def merge_moments(self, count, mean, m2):
+        """
+        Folds in the moments of another group of replicas (Chan et al. parallel update)
+        :param count: number of replicas in the group
+        :param mean: mean curve of the group
+        :param m2: sum of squared differences from the mean of the group
+        """
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    def merge(self, other):
+        """
+        Folds in another aggregator
+        :param other: Aggregator with curves of the same shape
+        """
+        self.merge_moments(other.count, other.mean, other.m2)
+
+    def variance(self):
+        """
+        :returns sample variance per element, nan with less than 2 replicas
+        """
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.count - 1)
+
+    def std(self):
+        """
+        :returns sample standard deviation per element
+        """
+        return np.sqrt(self.variance())
+
+    def ci(self, z=1.96):
+        """
+        :param z: z-value of the confidence level (95% by default)
+        :returns half width of the confidence interval of the mean per element
+        """
+        return z * self.std() / np.sqrt(max(self.count, 1))
@@ -0,0 +1,342 @@
+import sys
+import numpy as np
+
+from Agent import Mode, DISCOUNT_LIMIT, THOMPSON_STDEV, THOMPSON_PRIOR_MEAN, THOMPSON_PRIOR_STDEV
+from Aggregator import Aggregator
+from Problem import Dist
+
+
+def moments(values):
+    """
+    :param values: values of all replicas at one time step
+    :returns mean and sum of squared differences from the mean
+    """
+    mean = values.mean()
+    return mean, np.square(values - mean).sum()
+
+
+class BatchAgent:
+    def __init__(self, env, mode=Mode.GREEDY, epsilon=0.38, ucb_c=0.38, alpha=0.9, tau=0.12, gamma=0.99, window=100,
+                 step_size=None, rng=None):
+        """
+        Runs N independent replicas of the Agent at once, one per problem of a BatchProblem. Every per-arm quantity is
+        kept as an (N, k) array, so one call to choose_action() advances all replicas with a handful of vectorized
+        numpy operations.
+        :param env: the batch of N multi-armed bandits
+        :param mode: selected algorithm
+        :param epsilon: epsilon hyperparameter for eps-greedy
+        :param ucb_c: c hyperparameter for UCB
+        :param alpha: alpha hyperparameter for action preference
+        :param tau: hyperparameter for softmax
+        :param gamma: discount factor for discounted UCB
+        :param window: number of most recent steps used by sliding-window UCB
+        :param step_size: constant step size of the estimations for non-stationary problems (None for the sample
+        average 1 / t)
+        :param rng: numpy Generator used for the action selection draws (a fresh one by default)
+        """
+        self.env = env
+        self.mode = mode
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self.num = env.num  # number of replicas
+        self.arms = env.arms
+        self.rows = np.arange(self.num)
+
+        # time step, starts at 3 for UCB to avoid subunitary ln
+        self.step = 3 if mode == Mode.UCB else 1
+        self.average_rewards = np.empty((self.num, 0))
+        self.accuracy = np.empty((self.num, 0))
+        self.total_reward = np.zeros(self.num)
+        self.counter_selected_best = np.zeros(self.num)
+        self.reward_stats = None
+        self.accuracy_stats = None
+        self.scores = None
+        self.accuracy_scores = None
+
+        # Qt(a), optimistic for OPTIMISTIC and UCB
+        initial = 1 if mode == Mode.OPTIMISTIC or mode == Mode.UCB else 0
+        self.estimations = np.full((self.num, self.arms), initial, dtype=float)
+
+        # Na(t) starts at 1 to avoid division by 0 in UCB
+        self.uncertainties = np.ones((self.num, self.arms))
+
+        # Ht(a) and PIt(a) initialized to equal complementary probabilities
+        self.H = np.full((self.num, self.arms), 1 / self.arms)
+        self.pi = np.full((self.num, self.arms), 1 / self.arms)
+
+        # conjugate posteriors for Thompson sampling as (2, N, k): Beta (alpha, beta) for Bernoulli rewards, Normal
+        # (mean, precision) for Gaussian rewards, with the same prior as Agent
+        self.posterior = None
+        if mode == Mode.THOMPSON:
+            if env.dist_type == Dist.BERNOULLI:
+                self.posterior = np.ones((2, self.num, self.arms))
+            else:
+                self.posterior = np.empty((2, self.num, self.arms))
+                self.posterior[0] = THOMPSON_PRIOR_MEAN
+                self.posterior[1] = 1 / THOMPSON_PRIOR_STDEV ** 2
+
+        # discounted or windowed counts and reward sums for the non-stationary UCB modes, kept like in Agent
+        self.counts = None
+        self.sums = None
+        self.discount = 1
+        self.window_arms = None
+        self.window_rewards = None
+        if mode == Mode.DISCOUNTED_UCB or mode == Mode.SW_UCB:
+            self.counts = np.zeros((self.num, self.arms))
+            self.sums = np.zeros((self.num, self.arms))
+            if mode == Mode.SW_UCB:
+                self.window_arms = np.zeros((self.num, window), dtype=np.int64)
+                self.window_rewards = np.zeros((self.num, window))
+
+        # hyperparameters:
+        self.epsilon = epsilon
+        self.ucb_c = ucb_c
+        self.alpha = alpha
+        self.tau = tau
+        self.gamma = gamma
+        self.window = window
+        self.step_size = step_size
+        self.played = 0  # number of steps played so far
+
+    def run(self, max_steps=1000, record=True):
+        """
+        Runs all replicas on their problems. The mean and variance over the replicas of the average reward and
+        accuracy are kept per step in reward_stats and accuracy_stats, and the average reward and accuracy over all
+        steps of every replica in scores and accuracy_scores.
+        :param max_steps: Max number of epochs
+        :param record: If True, also stores the per-step average rewards and accuracies as (N, steps) arrays.
+        Otherwise memory does not grow with the number of steps times the number of replicas.
+        """
+        if record:
+            average_rewards = np.empty((self.num, max_steps))
+            accuracy = np.empty((self.num, max_steps))
+        reward_moments = np.empty((2, max_steps))
+        accuracy_moments = np.empty((2, max_steps))
+        reward_sum = np.zeros(self.num)
+        accuracy_sum = np.zeros(self.num)
+        for t in range(max_steps):
+            arms, rewards, is_best = self.choose_action()
+            self.total_reward += rewards
+            self.counter_selected_best += is_best
+            step_rewards = self.total_reward / self.step
+            step_accuracy = self.counter_selected_best / self.step
+            reward_sum += step_rewards
+            accuracy_sum += step_accuracy
+            reward_moments[:, t] = moments(step_rewards)
+            accuracy_moments[:, t] = moments(step_accuracy)
+            if record:
+                average_rewards[:, t] = step_rewards
+                accuracy[:, t] = step_accuracy
+            self.update_parameters(arms, rewards, step_rewards)
+            self.step += 1
+            self.played += 1
+
+        self.reward_stats = Aggregator(max_steps)
+        self.reward_stats.merge_moments(self.num, *reward_moments)
+        self.accuracy_stats = Aggregator(max_steps)
+        self.accuracy_stats.merge_moments(self.num, *accuracy_moments)
+        self.scores = reward_sum / max_steps
+        self.accuracy_scores = accuracy_sum / max_steps
+        if record:
+            self.average_rewards = np.concatenate((self.average_rewards, average_rewards), axis=1)
+            self.accuracy = np.concatenate((self.accuracy, accuracy), axis=1)
+
+    def choose_action(self):
+        """
+        Calls appropriate action selection method based on mode.
+        :returns the selected arms, the resultant rewards and whether each selected arm is a best arm
+        """
+        match self.mode:
+            case Mode.GREEDY | Mode.OPTIMISTIC:
+                selected_arms = self.greedy()
+            case Mode.EPSILON_GREEDY:
+                selected_arms = self.epsilon_greedy()
+            case Mode.SOFTMAX | Mode.ACTION_PREFERENCES:
+                selected_arms = self.categorical_draw()
+            case Mode.UCB:
+                selected_arms = self.ucb()
+            case Mode.THOMPSON:
+                selected_arms = self.thompson()
+            case Mode.DISCOUNTED_UCB | Mode.SW_UCB:
+                selected_arms = self.windowed_ucb()
+            case _:
+                sys.exit("Invalid selection mode selected!")
+        rewards, is_best = self.env.pull_arms(selected_arms)
+        return selected_arms, rewards, is_best
+
+    def random_argmax(self, values):
+        """
+        Row-wise argmax, ties are broken uniformly at random
+        :param values: (N, k) array
+        :returns selected column per row
+        """
+        ties = values == values.max(axis=1, keepdims=True)
+        return np.argmax(self.rng.random(values.shape) * ties, axis=1)
+
+    def greedy(self):
+        """
+        Selects actions for the greedy algorithm
+        :returns selected actions
+        """
+        return self.random_argmax(self.estimations)
+
+    def epsilon_greedy(self):
+        """
+        Selects actions for the epsilon greedy algorithm
+        :returns selected actions
+        """
+        explore = self.rng.random(self.num) <= self.epsilon
+        random_arms = self.rng.integers(0, self.arms, size=self.num)
+        return np.where(explore, random_arms, self.greedy())
+
+    def ucb(self):
+        """
+        Selects actions for the UCB algorithm, scores are compared at one decimal like Agent.ucb
+        :returns selected actions
+        """
+        scores = self.estimations + self.ucb_c * np.sqrt(np.log(self.step) / self.uncertainties)
+        return self.random_argmax(np.round(scores, 1))
+
+    def thompson(self):
+        """
+        Selects actions for Thompson sampling, with one draw for the posteriors of all arms of all replicas
+        :returns selected actions
+        """
+        if self.env.dist_type == Dist.BERNOULLI:
+            samples = self.rng.beta(self.posterior[0], self.posterior[1])
+        else:
+            samples = self.rng.normal(self.posterior[0], 1 / np.sqrt(self.posterior[1]))
+        return np.argmax(samples, axis=1)
+
+    def windowed_ucb(self):
+        """
+        Selects actions for discounted UCB and sliding-window UCB like Agent.windowed_ucb
+        :returns selected actions
+        """
+        if self.mode == Mode.DISCOUNTED_UCB:
+            counts = self.counts / self.discount
+            totals = counts.sum(axis=1, keepdims=True)
+        else:
+            counts = self.counts
+            totals = np.full((self.num, 1), min(self.played, self.window))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = self.sums / self.counts + self.ucb_c * np.sqrt(np.log(np.maximum(totals, 1)) / counts)
+        scores[counts <= 0] = np.inf
+        return self.random_argmax(scores)
+
+    def categorical_draw(self):
+        """
+        Arm selection based on pi probability for softmax/action preferences
+        :returns selected actions
+        """
+        z = self.rng.random((self.num, 1))
+        cum_prob = np.cumsum(self.pi, axis=1)
+        # first arm whose cumulative probability exceeds z, last arm if there is none
+        return np.minimum((cum_prob <= z).sum(axis=1), self.arms - 1)
+
+    def update_parameters(self, arms, rewards, average_rewards):
+        """
+        Calls appropriate methods for parameter updating, depending on selected algorithm
+        :param arms: selected arms
+        :param rewards: obtained rewards
+        :param average_rewards: average rewards including this step
+        """
+        self.update_estimations(arms, rewards)
+        match self.mode:
+            case Mode.UCB:
+                self.uncertainties[self.rows, arms] += 1
+            case Mode.SOFTMAX:
+                self.update_pi(arms)
+            case Mode.ACTION_PREFERENCES:
+                self.update_preferences(arms, rewards, average_rewards)
+                self.update_pi(arms)
+            case Mode.THOMPSON:
+                self.update_posterior(arms, rewards)
+            case Mode.DISCOUNTED_UCB:
+                self.update_discounted(arms, rewards)
+            case Mode.SW_UCB:
+                self.update_window(arms, rewards)
+
+    def update_estimations(self, arms, rewards):
+        """
+        incremental sample-average update of the selected arms, with the same 1 / step size as Agent or the constant
+        step_size
+        :param arms: Selected arms
+        :param rewards: Resultant rewards
+        """
+        selected = self.estimations[self.rows, arms]
+        if self.step_size is None:
+            self.estimations[self.rows, arms] = selected + (rewards - selected) / self.step
+        else:
+            self.estimations[self.rows, arms] = selected + self.step_size * (rewards - selected)
+
+    def update_posterior(self, arms, rewards):
+        """
+        Conjugate update of the posteriors of the selected arms
+        :param arms: Selected arms
+        :param rewards: Resultant rewards
+        """
+        first, second = self.posterior[0], self.posterior[1]
+        if self.env.dist_type == Dist.BERNOULLI:
+            first[self.rows, arms] += rewards
+            second[self.rows, arms] += 1 - rewards
+        else:
+            mean, precision = first[self.rows, arms], second[self.rows, arms]
+            updated = precision + 1 / THOMPSON_STDEV ** 2
+            first[self.rows, arms] = (mean * precision + rewards / THOMPSON_STDEV ** 2) / updated
+            second[self.rows, arms] = updated
+
+    def update_discounted(self, arms, rewards):
+        """
+        Discounts all counts and sums by gamma and adds the rewards of the selected arms, with the lazy discount
+        factor of Agent.update_discounted
+        :param arms: Selected arms
+        :param rewards: Resultant rewards
+        """
+        self.discount /= self.gamma
+        if self.discount > DISCOUNT_LIMIT:
+            self.counts /= self.discount
+            self.sums /= self.discount
+            self.discount = 1
+        self.counts[self.rows, arms] += self.discount
+        self.sums[self.rows, arms] += self.discount * rewards
+
+    def update_window(self, arms, rewards):
+        """
+        Adds the rewards of the selected arms to the windows and removes the step that falls out of them
+        :param arms: Selected arms
+        :param rewards: Resultant rewards
+        """
+        position = self.played % self.window
+        if self.played >= self.window:
+            old = self.window_arms[:, position]
+            self.counts[self.rows, old] -= 1
+            self.sums[self.rows, old] -= self.window_rewards[:, position]
+        self.window_arms[:, position] = arms
+        self.window_rewards[:, position] = rewards
+        self.counts[self.rows, arms] += 1
+        self.sums[self.rows, arms] += rewards
+
+    def update_preferences(self, arms, rewards, average_rewards):
+        """
+        Updates the action preferences of all arms for action preferences
+        :param arms: Selected arms
+        :param rewards: Rewards from selected actions
+        :param average_rewards: average rewards including this step
+        """
+        regret = self.alpha * (rewards - average_rewards)
+        self.H -= regret[:, None] * self.pi
+        self.H[self.rows, arms] += regret
+
+    def update_pi(self, arms):
+        """
+        Updates the pi value of all arms for softmax/action preferences, as a max-shifted softmax over Qt(a) / tau or
+        Ht(a) like the SoftmaxTree of Agent
+        :param arms: Selected arms
+        """
+        if self.mode == Mode.SOFTMAX:
+            logits = self.estimations / self.tau
+        else:
+            logits = self.H
+        weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+        self.pi = weights / weights.sum(axis=1, keepdims=True)
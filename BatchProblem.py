@@ -0,0 +1,77 @@
+import sys
+
+import numpy as np
+
+from Problem import Dist
+
+
+class BatchProblem:
+    def __init__(self, n, k, dist_type=Dist.GAUSS, rng=None, block_size=256):
+        """
+        Initializes n multi-armed bandit problems at once. Arm parameters are kept as (n, k) arrays and one call to
+        pull_arms pulls one arm in every problem.
+        :param n: Number of problem instances
+        :param k: Number of arms
+        :param dist_type: Reward distribution (Gaussian dist_type. by default)
+        :param rng: numpy Generator used for all random draws (a fresh one by default)
+        :param block_size: Number of pulls for which reward noise is sampled in one go
+        """
+        self.num = n  # number of problem instances
+        self.arms = k  # number of arms
+        self.dist_type = dist_type  # reward distribution type
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block_size = block_size
+        self.rows = np.arange(n)
+
+        # initialize reward distributions, same ranges as Problem
+        if dist_type == Dist.GAUSS:
+            self.means = self.rng.uniform(.3, 1, size=(n, k))
+            self.stdevs = np.full((n, k), 0.2)
+        elif dist_type == Dist.BERNOULLI:
+            self.means = self.rng.uniform(0, 1, size=(n, k))  # reward probability for each arm
+            self.stdevs = None
+        else:
+            # invalid distribution provided, exit
+            sys.exit("Invalid distribution (dist_type = " + str(dist_type) + ") provided!")
+
+        self.best = None
+        self.noise = None
+        self.noise_index = 0
+        self.find_best_actions()
+
+    def find_best_actions(self):
+        """
+        Marks the arms with the highest mean reward / probability of a reward in every problem. Computed once, as
+        the arms do not change.
+        """
+        self.best = self.means == self.means.max(axis=1, keepdims=True)
+
+    def next_noise(self):
+        """
+        Returns the noise for one pull in every problem: standard normal draws for Gaussian arms and uniform draws
+        for Bernoulli arms. Noise is sampled for block_size pulls at a time.
+        :returns (n,) noise array
+        """
+        if self.noise is None or self.noise_index == self.block_size:
+            if self.dist_type == Dist.GAUSS:
+                self.noise = self.rng.standard_normal((self.block_size, self.num))
+            else:
+                self.noise = self.rng.random((self.block_size, self.num))
+            self.noise_index = 0
+        self.noise_index += 1
+        return self.noise[self.noise_index - 1]
+
+    def pull_arms(self, arms):
+        """
+        Pulls one arm in every problem
+        :param arms: Action to perform / arm to pull per problem
+        :returns Rewards and whether each selected action is a best action
+        """
+        noise = self.next_noise()
+        means = self.means[self.rows, arms]
+        if self.dist_type == Dist.GAUSS:
+            # limit rewards to the 0 - 1 range
+            rewards = np.clip(means + self.stdevs[self.rows, arms] * noise, 0, 1)
+        else:
+            rewards = (noise < means).astype(float)
+        return rewards, self.best[self.rows, arms]
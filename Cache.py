@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from Aggregator import Aggregator
+from Runner import SHARD_SIZE, config_name
+
+# modules whose source determines the simulation results, part of every cache key
+SOURCES = ['Agent.py', 'Aggregator.py', 'BatchAgent.py', 'BatchProblem.py', 'Problem.py', 'Runner.py']
+
+
+def code_version():
+    """
+    Hashes the source of the simulation modules, so results of older code are never served from the cache
+    :returns hex digest of the sources
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory='results'):
+        """
+        On-disk cache of aggregated experiment results. Every entry is a directory named after the hash of its
+        configuration, holding one subdirectory per number of replicas with the mean and M2 curves as .npy files.
+        :param directory: Root directory of the cache
+        """
+        self.directory = directory
+        self.version = code_version()
+
+    def key(self, mode, params, dist_type, k, steps, seed):
+        """
+        Content address of a configuration, the number of replicas is part of the path below it
+        :param mode: selected algorithm
+        :param params: keyword arguments for the agent
+        :param dist_type: Reward distribution type
+        :param k: Number of arms
+        :param steps: Number of time steps per replica
+        :param seed: Master seed
+        :returns hex digest
+        """
+        text = json.dumps([config_name(mode, params), dist_type.name, k, steps, seed, self.version])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key, num=None):
+        """
+        :param key: Key of the configuration
+        :param num: Number of replicas (None for the directory of the configuration)
+        :returns directory of the entry
+        """
+        if num is None:
+            return os.path.join(self.directory, key)
+        return os.path.join(self.directory, key, str(num))
+
+    def largest(self, key, max_num):
+        """
+        Finds the largest cached number of replicas that does not exceed max_num and can be extended: max_num itself
+        or a multiple of SHARD_SIZE. Other entries end inside a shard, and extending them would split the remaining
+        replicas into different shards than a fresh run, so the results would depend on the history of the cache.
+        :param key: Key of the configuration
+        :param max_num: Max number of replicas
+        :returns number of replicas, 0 if there is no such entry
+        """
+        if not os.path.isdir(self.path(key)):
+            return 0
+        nums = [int(name) for name in os.listdir(self.path(key))
+                if name.isdigit() and (int(name) == max_num or int(name) % SHARD_SIZE == 0 and int(name) < max_num)]
+        return max(nums, default=0)
+
+    def load(self, key, num):
+        """
+        Loads an entry with memory-mapped, read-only curves
+        :param key: Key of the configuration
+        :param num: Number of replicas
+        :returns (average reward, accuracy) Aggregators, None if the entry is not cached
+        """
+        path = self.path(key, num)
+        if not os.path.isdir(path):
+            return None
+        aggregators = []
+        for name in ('rewards', 'accuracies'):
+            aggregator = Aggregator(0)
+            aggregator.count = num
+            aggregator.mean = np.load(os.path.join(path, name + '_mean.npy'), mmap_mode='r')
+            aggregator.m2 = np.load(os.path.join(path, name + '_m2.npy'), mmap_mode='r')
+            aggregators.append(aggregator)
+        return tuple(aggregators)
+
+    def store(self, key, rewards, accuracies):
+        """
+        Stores an entry. It is written to a temporary directory first and then renamed, so readers never see
+        partial entries.
+        :param key: Key of the configuration
+        :param rewards: Aggregator of the average reward curves
+        :param accuracies: Aggregator of the accuracy curves
+        """
+        path = self.path(key, rewards.count)
+        if os.path.isdir(path):
+            return
+        tmp = path + '.tmp' + str(os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        for name, aggregator in (('rewards', rewards), ('accuracies', accuracies)):
+            np.save(os.path.join(tmp, name + '_mean.npy'), aggregator.mean)
+            np.save(os.path.join(tmp, name + '_m2.npy'), aggregator.m2)
+        try:
+            os.rename(tmp, path)
+        except OSError:  # stored by another process in the meantime
+            shutil.rmtree(tmp)
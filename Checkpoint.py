@@ -0,0 +1,148 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from Agent import Agent, Mode
+from DriftingProblem import DriftingProblem
+from MaxTree import MaxTree
+from Problem import Problem, Dist
+
+
+def rng_state(rng):
+    """
+    :param rng: the random module, a random.Random, the numpy.random module or a numpy Generator
+    :returns JSON-serializable state of the source of random numbers
+    """
+    if rng is random or isinstance(rng, random.Random):
+        version, internal, gauss_next = rng.getstate()
+        return {'kind': 'random' if rng is random else 'Random', 'state': [version, list(internal), gauss_next]}
+    if rng is np.random:
+        state = rng.get_state(legacy=False)
+        state['state']['key'] = state['state']['key'].tolist()
+        return {'kind': 'numpy', 'state': state}
+    if isinstance(rng, np.random.Generator):
+        return {'kind': 'Generator', 'state': rng.bit_generator.state}
+    raise TypeError("Cannot save the state of " + type(rng).__name__)
+
+
+def restore_rng(saved):
+    """
+    :param saved: state returned by rng_state
+    :returns the source of random numbers in the saved state. The random and numpy.random modules are set to the
+    saved state and returned themselves.
+    """
+    state = saved['state']
+    match saved['kind']:
+        case 'random' | 'Random':
+            rng = random if saved['kind'] == 'random' else random.Random()
+            rng.setstate((state[0], tuple(state[1]), state[2]))
+        case 'numpy':
+            rng = np.random
+            state['state']['key'] = np.array(state['state']['key'], dtype=np.uint32)
+            rng.set_state(state)
+        case 'Generator':
+            rng = np.random.Generator(getattr(np.random, state['bit_generator'])())
+            rng.bit_generator.state = state
+        case _:
+            raise ValueError("Unknown kind of random number source: " + str(saved['kind']))
+    return rng
+
+
+def save_checkpoint(path, agent):
+    """
+    Saves the full state of an Agent and its Problem, so the run can be resumed exactly with load_checkpoint. The
+    history lists of Agent.run are not saved. The file is written next to the target and renamed, so a crash while
+    saving leaves the previous checkpoint intact.
+    :param path: .npz file
+    :param agent: the Agent
+    """
+    env = agent.env
+    meta = {
+        'mode': agent.mode.name,
+        'params': {'epsilon': agent.epsilon, 'ucb_c': agent.ucb_c, 'alpha': agent.alpha, 'tau': agent.tau,
+                   'gamma': agent.gamma, 'window': agent.window, 'step_size': agent.step_size},
+        'step': agent.step,
+        'start_step': agent.start_step,
+        'total_reward': agent.total_reward,
+        'counter_selected_best': agent.counter_selected_best,
+        'ucb_scale': agent.ucb_scale,
+        'discount': agent.discount,
+        'shift': agent.policy.shift if agent.policy is not None else None,
+        'dist_type': env.dist_type.name,
+        'drift': [env.drift, env.hazard] if isinstance(env, DriftingProblem) else None,
+        'best_actions': env.best_actions,
+        'agent_rng': rng_state(agent.rng),
+        'env_rng': rng_state(env.rng),
+        'sampler': rng_state(agent.sampler) if agent.sampler is not None else None,
+    }
+    arrays = {
+        'estimations': agent.estimations,
+        'means': env.means,
+    }
+    if env.stdevs is not None:
+        arrays['stdevs'] = env.stdevs
+    if agent.index is not None:  # the argmax index is saved as is, so ties are broken the same way after resuming
+        arrays['index'] = np.array(agent.index.values[agent.index.size:agent.index.size + env.arms])
+    if agent.posterior is not None:
+        arrays['posterior'] = agent.posterior
+    for name in ('uncertainties', 'H', 'counts', 'sums', 'window_arms', 'window_rewards'):
+        if getattr(agent, name) is not None:
+            arrays[name] = getattr(agent, name)
+    if agent.policy is not None:
+        arrays['logits'] = np.array(agent.policy.logits)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as file:
+        np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """
+    Restores an Agent and its Problem saved with save_checkpoint
+    :param path: .npz file
+    :returns the Agent, whose env is the restored Problem
+    """
+    with np.load(path) as saved:
+        meta = json.loads(saved['meta'].item())
+        arrays = {name: saved[name] for name in saved.files if name != 'meta'}
+
+    # the random draws of the constructors do not matter, the sources of random numbers are restored afterwards
+    k, dist_type = len(arrays['means']), Dist[meta['dist_type']]
+    if meta['drift'] is None:
+        env = Problem(k, dist_type=dist_type, rng=np.random.default_rng())
+    else:
+        env = DriftingProblem(k, dist_type=dist_type, drift=meta['drift'][0], hazard=meta['drift'][1],
+                              rng=np.random.default_rng())
+    env.means = arrays['means']
+    env.stdevs = arrays.get('stdevs')
+    env.best_actions = meta['best_actions']
+    env.best[:] = False
+    env.best[env.best_actions] = True
+    env.rng = restore_rng(meta['env_rng'])
+    agent = Agent(env, mode=Mode[meta['mode']], rng=restore_rng(meta['agent_rng']), **meta['params'])
+
+    agent.step = meta['step']
+    agent.start_step = meta['start_step']
+    agent.total_reward = meta['total_reward']
+    agent.counter_selected_best = meta['counter_selected_best']
+    agent.ucb_scale = meta['ucb_scale']
+    agent.estimations = arrays['estimations']
+    if 'uncertainties' in arrays:
+        agent.uncertainties = arrays['uncertainties']
+    if 'H' in arrays:
+        agent.H = arrays['H']
+    if 'index' in arrays:
+        agent.index = MaxTree(arrays['index'].tolist())
+    if 'posterior' in arrays:
+        agent.posterior = arrays['posterior']
+        agent.sampler = restore_rng(meta['sampler'])
+    agent.discount = meta['discount']
+    for name in ('counts', 'sums', 'window_arms', 'window_rewards'):
+        if name in arrays:
+            setattr(agent, name, arrays[name])
+    if 'logits' in arrays:
+        agent.policy.rebuild(arrays['logits'].tolist(), shift=meta['shift'])
+    return agent
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class ContextualProblem:
+    def __init__(self, k, d, shared=False, stdev=0.2, rng=None):
+        """
+        Contextual multi-armed bandit with a linear reward model. Before every pull a context is observed and the
+        reward of an arm is linear in the context plus Gaussian noise:
+        - disjoint model (shared=False): one context x of dimension d per step and one weight vector per arm,
+        E[r | a] = x . theta_a
+        - shared model (shared=True): one feature vector x_a per arm and step and one weight vector for all arms,
+        E[r | a] = x_a . theta
+        Contexts and weights are drawn uniformly from the unit sphere, so expected rewards lie in [-1, 1].
+        :param k: Number of arms
+        :param d: Dimension of the contexts
+        :param shared: If True, uses the shared model, otherwise the disjoint model
+        :param stdev: Standard deviation of the reward noise
+        :param rng: numpy Generator used for all random draws (a fresh one by default)
+        """
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.arms = k  # number of arms
+        self.dim = d  # dimension of the contexts
+        self.shared = shared
+        self.stdev = stdev
+        self.theta = self.unit_vectors(d if shared else (k, d))  # (d,) or (k, d) weights
+        self.context = None  # current context, (d,) for the disjoint and (k, d) for the shared model
+        self.expected = None  # expected reward of every arm in the current context
+
+    def unit_vectors(self, shape):
+        """
+        :param shape: Shape of the vectors, the last axis is the dimension
+        :returns vectors drawn uniformly from the unit sphere
+        """
+        vectors = self.rng.standard_normal(shape)
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def next_context(self):
+        """
+        Draws the context of the next pull
+        :returns the context, (d,) for the disjoint and (k, d) for the shared model
+        """
+        if self.shared:
+            self.context = self.unit_vectors((self.arms, self.dim))
+            self.expected = self.context @ self.theta
+        else:
+            self.context = self.unit_vectors(self.dim)
+            self.expected = self.theta @ self.context
+        return self.context
+
+    def best_action(self):
+        """
+        :returns the action with the highest expected reward in the current context
+        """
+        return int(np.argmax(self.expected))
+
+    def pull_arm(self, a):
+        """
+        Pulls an arm in the current context to retrieve the reward
+        :param a: Action to perform / arm to pull
+        :returns Reward for the action and whether the selected action is the best action (1 if best, otherwise 0)
+        """
+        reward = self.expected[a] + self.stdev * self.rng.standard_normal()
+        is_best = 1 if self.expected[a] == self.expected.max() else 0
+        return float(reward), is_best
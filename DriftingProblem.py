@@ -0,0 +1,52 @@
+import numpy as np
+
+from Problem import Problem, Dist
+
+
+class DriftingProblem(Problem):
+    __slots__ = ('drift', 'hazard')
+
+    def __init__(self, k, dist_type=Dist.GAUSS, drift=0.01, hazard=0.0, verbose=False, rng=None):
+        """
+        Multi-armed bandit problem whose arms change over time. After every pull, the mean reward (Gaussian) or
+        reward probability (Bernoulli) of every arm takes a Gaussian random walk step, and with probability hazard all
+        arms are drawn again from scratch (abrupt change point).
+        :param k: Number of arms
+        :param dist_type: Reward distribution (Gaussian dist_type. by default)
+        :param drift: Standard deviation of the random walk step per pull, 0 for piecewise-constant arms
+        :param hazard: Probability of a change point after every pull
+        :param verbose: If True, prints additional information about the problem
+        :param rng: source of random numbers with the interface of numpy.random, e.g. a numpy Generator
+        (the numpy.random module by default)
+        """
+        super().__init__(k, dist_type=dist_type, verbose=verbose, rng=rng)
+        self.drift = drift
+        self.hazard = hazard
+
+    def pull_arm(self, a):
+        """
+        Pulls an arm to retrieve the reward, then lets the arms drift
+        :param a: Action to perform / arm to pull
+        :returns Reward for the action and whether the selected action is the best action (1 if best, otherwise 0)
+        """
+        reward, is_best = super().pull_arm(a)
+        self.advance()
+        return reward, is_best
+
+    def advance(self):
+        """
+        Moves the arms one step forward in time
+        """
+        if self.hazard > 0 and self.rng.uniform(0, 1) < self.hazard:
+            if self.dist_type == Dist.GAUSS:
+                self.generate_reward_dists()
+            else:
+                self.generate_probabilities()
+        elif self.drift > 0:
+            low = .3 if self.dist_type == Dist.GAUSS else 0  # same ranges as the initial arms
+            self.means = np.clip(self.means + self.rng.normal(0, self.drift, size=self.arms), low, 1)
+        else:
+            return
+        self.best_actions = self.find_best_actions()
+        self.best[:] = False
+        self.best[self.best_actions] = True
@@ -0,0 +1,72 @@
+import numpy as np
+
+from BatchProblem import BatchProblem
+from Problem import Dist
+
+# multipliers of the splitmix64 finalizer
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def mix(x):
+    """
+    splitmix64 finalizer: maps 64-bit integers to well-mixed 64-bit integers
+    :param x: uint64 array
+    :returns uint64 array
+    """
+    x = (x ^ (x >> np.uint64(30))) * MIX_1
+    x = (x ^ (x >> np.uint64(27))) * MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+class HashedProblem(BatchProblem):
+    def __init__(self, n, k, dist_type=Dist.GAUSS, rng=None):
+        """
+        BatchProblem whose reward streams are fixed: the reward of the j-th pull of an arm only depends on (problem,
+        arm, pull count). After reset() the same problems return the same rewards again, so different algorithms can
+        be compared on common random numbers. The rewards are computed on demand by hashing (problem key, arm, pull
+        count) instead of being stored, so memory is O(n * k) for the pull counts, whatever the number of steps.
+        :param n: Number of problem instances
+        :param k: Number of arms
+        :param dist_type: Reward distribution (Gaussian dist_type. by default)
+        :param rng: numpy Generator used for all random draws (a fresh one by default)
+        """
+        super().__init__(n, k, dist_type=dist_type, rng=rng)
+        self.keys = self.rng.integers(0, 2 ** 64, size=n, dtype=np.uint64)  # key of the reward streams per problem
+        self.pulls = np.zeros((n, k), dtype=np.int64)  # number of pulls per arm so far
+
+    def reset(self):
+        """
+        Rewinds all reward streams to their first reward
+        """
+        self.pulls[:] = 0
+
+    def uniform(self, streams, pulls, draw):
+        """
+        Uniform random numbers of the given pulls of the given streams
+        :param streams: uint64 key per stream, see pull_arms
+        :param pulls: pull count per stream
+        :param draw: index of the draw within a pull (Gaussian rewards take 2)
+        :returns uniform values in [0, 1)
+        """
+        counters = pulls.astype(np.uint64) * np.uint64(2) + np.uint64(draw)
+        return (mix(streams + counters) >> np.uint64(11)) * 2.0 ** -53
+
+    def pull_arms(self, arms):
+        """
+        Pulls one arm in every problem and returns the next reward in the stream of that arm
+        :param arms: Action to perform / arm to pull per problem
+        :returns Rewards and whether each selected action is a best action
+        """
+        pulls = self.pulls[self.rows, arms]
+        self.pulls[self.rows, arms] = pulls + 1
+        streams = mix(self.keys + np.asarray(arms, dtype=np.uint64))
+        means = self.means[self.rows, arms]
+        if self.dist_type == Dist.GAUSS:
+            # Box-Muller transform of two uniforms
+            radius = np.sqrt(-2 * np.log(1 - self.uniform(streams, pulls, 0)))
+            noise = radius * np.cos(2 * np.pi * self.uniform(streams, pulls, 1))
+            rewards = np.clip(means + self.stdevs[self.rows, arms] * noise, 0, 1)
+        else:
+            rewards = (self.uniform(streams, pulls, 0) < means).astype(float)
+        return rewards, self.best[self.rows, arms]
@@ -0,0 +1,322 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Agent import Mode
+from Aggregator import Aggregator
+from Cache import ResultCache
+from Problem import Dist
+from Runner import SHARD_SIZE, config_seed, run_shard, shard_sizes
+from Sweep import grid_search
+
+# names of the Aggregators returned by Runner.run_shard, in order
+PARTS = ('rewards', 'accuracies', 'scores', 'accuracy_scores')
+
+
+def expand(spec):
+    """
+    Expands a sweep spec into work units. The spec is a dict with the keys
+    - modes: list of Mode names
+    - params: list of values per Agent constructor parameter, every combination is run (optional)
+    - dists: list of Dist names, arms: list of numbers of arms
+    - num: replicas per configuration, steps: time steps per replica, seed: integer master seed
+    - shard_size: replicas per work unit (optional)
+    Every unit carries its own seed, spawned like in Runner.make_units, so its result does not depend on which
+    worker runs it or how often, and the merged results equal those of Runner.run_experiment.
+    :param spec: the sweep spec
+    :returns list of units as JSON-serializable dicts, each with a content-derived id
+    :raises ValueError: if the spec has no integer seed. Without one the seeds, and with them the ids of the units,
+    would change on every call, so a sweep could not be resubmitted or reduced.
+    """
+    if not isinstance(spec.get('seed'), int) or isinstance(spec['seed'], bool):
+        raise ValueError("the sweep spec needs an integer 'seed', got " + repr(spec.get('seed')))
+    units = []
+    for mode in spec['modes']:
+        for params in grid_search(**spec.get('params', {})):
+            for dist in spec['dists']:
+                for k in spec['arms']:
+                    seed = config_seed(spec['seed'], Mode[mode], params)
+                    sizes = shard_sizes(spec['num'], spec.get('shard_size', SHARD_SIZE))
+                    for shard, size in enumerate(sizes):
+                        unit = {'mode': mode, 'params': params, 'dist': dist, 'arms': k, 'steps': spec['steps'],
+                                'size': size, 'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key) + [shard],
+                                'seed': spec['seed'], 'shard': shard}
+                        text = json.dumps(unit, sort_keys=True)
+                        unit['id'] = hashlib.sha256(text.encode()).hexdigest()[:24]
+                        units.append(unit)
+    return units
+
+
+def config_key(unit):
+    """
+    :param unit: work unit
+    :returns JSON key of the configuration the unit belongs to
+    """
+    return json.dumps([unit['mode'], unit['params'], unit['dist'], unit['arms'], unit['steps'], unit['seed']],
+                      sort_keys=True)
+
+
+class JobQueue:
+    def __init__(self, directory, lease_seconds=600):
+        """
+        File-backed job broker in a directory that all workers can reach, e.g. on a shared file system. Every unit
+        is a file that moves between the subdirectories todo, leased and done with atomic renames, so exactly one
+        worker wins every lease without any locking. Results are written next to their target and renamed, so a
+        crash never leaves a partial result. Leases older than lease_seconds are requeued, so workers renew the lease
+        of the unit they run every lease_seconds / 3.
+        :param directory: Root directory of the queue
+        :param lease_seconds: Seconds after which the unit of a silent worker is given to another one
+        """
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.worker = socket.gethostname() + '-' + str(os.getpid())
+        for name in ('todo', 'leased', 'done'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def path(self, state, unit_id, suffix='.json'):
+        """
+        :param state: todo, leased or done
+        :param unit_id: id of the unit
+        :param suffix: file extension
+        :returns path of the file of the unit
+        """
+        return os.path.join(self.directory, state, unit_id + suffix)
+
+    def submit(self, spec):
+        """
+        Adds the units of a sweep spec. Units that are queued, leased or done already are skipped, so submitting
+        the same spec again only adds what is missing.
+        :param spec: the sweep spec, see expand
+        :returns number of added units
+        """
+        added = 0
+        for unit in expand(spec):
+            if any(os.path.exists(self.path(state, unit['id'], suffix))
+                   for state, suffix in (('todo', '.json'), ('leased', '.json'), ('done', '.npz'))):
+                continue
+            tmp = self.path('todo', unit['id'], '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(unit, f)
+            os.replace(tmp, self.path('todo', unit['id']))
+            added += 1
+        return added
+
+    def requeue_expired(self):
+        """
+        Moves leases older than lease_seconds back to todo
+        :returns number of requeued units
+        """
+        requeued = 0
+        now = time.time()
+        for name in os.listdir(os.path.join(self.directory, 'leased')):
+            path = os.path.join(self.directory, 'leased', name)
+            try:
+                if now - os.path.getmtime(path) > self.lease_seconds:
+                    os.rename(path, os.path.join(self.directory, 'todo', name))
+                    requeued += 1
+            except FileNotFoundError:  # finished or requeued by another worker in the meantime
+                pass
+        return requeued
+
+    def lease(self):
+        """
+        Takes one unit from todo. The lease time is the modification time of the file, which is set before the file
+        is moved to leased, so a lease never shows up in leased with the old submit time.
+        :returns the unit, None if todo is empty
+        """
+        for name in sorted(os.listdir(os.path.join(self.directory, 'todo'))):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, 'leased', name)
+            try:
+                os.utime(os.path.join(self.directory, 'todo', name))  # the lease starts now
+                os.rename(os.path.join(self.directory, 'todo', name), path)
+                with open(path) as f:
+                    return json.load(f)
+            except FileNotFoundError:  # leased by another worker, or requeued right away
+                continue
+        return None
+
+    def renew(self, unit):
+        """
+        Restarts the lease of a unit that is still running
+        :param unit: the unit
+        :returns False if the lease expired and the unit was requeued in the meantime
+        """
+        try:
+            os.utime(self.path('leased', unit['id']))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def keep_lease(self, unit, stop):
+        """
+        Renews the lease of a unit every lease_seconds / 3 until stop is set. Runs in a thread next to the unit.
+        :param unit: the unit
+        :param stop: threading.Event that is set when the unit is finished
+        """
+        while not stop.wait(self.lease_seconds / 3):
+            self.renew(unit)
+
+    def complete(self, unit, partials):
+        """
+        Stores the result of a unit and releases its lease
+        :param unit: the unit
+        :param partials: Aggregators returned by Runner.run_shard
+        """
+        arrays = {}
+        for name, aggregator in zip(PARTS, partials):
+            arrays[name + '_count'] = np.array(aggregator.count)
+            arrays[name + '_mean'] = aggregator.mean
+            arrays[name + '_m2'] = aggregator.m2
+        tmp = self.path('done', unit['id'], '.' + self.worker + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self.path('done', unit['id'], '.npz'))
+        self.release(unit)
+
+    def release(self, unit):
+        """
+        Removes the lease of a finished unit
+        :param unit: the unit
+        """
+        try:
+            os.remove(self.path('leased', unit['id']))
+        except FileNotFoundError:  # the lease expired and the unit was finished twice, both results are the same
+            pass
+
+    def status(self):
+        """
+        :returns number of units per state
+        """
+        return {state: sum(name.endswith(suffix) for name in os.listdir(os.path.join(self.directory, state)))
+                for state, suffix in (('todo', '.json'), ('leased', '.json'), ('done', '.npz'))}
+
+    def work(self, poll=1.0, max_units=None):
+        """
+        Runs units until the queue is empty. Expired leases of other workers are requeued on the way, and a worker
+        waits for the leases of others while any are left, in case they have to be taken over.
+        :param poll: Seconds between checks while only leased units are left
+        :param max_units: Max number of units to run (None for no limit)
+        :returns number of units run
+        """
+        done = 0
+        while max_units is None or done < max_units:
+            self.requeue_expired()
+            unit = self.lease()
+            if unit is None:
+                if self.status()['leased'] == 0:
+                    break
+                time.sleep(poll)
+                continue
+            if os.path.exists(self.path('done', unit['id'], '.npz')):  # finished before its lease expired
+                self.release(unit)
+                continue
+            seed = np.random.SeedSequence(unit['entropy'], spawn_key=tuple(unit['spawn_key']))
+            stop = threading.Event()
+            keeper = threading.Thread(target=self.keep_lease, args=(unit, stop), daemon=True)
+            keeper.start()
+            try:
+                partials = run_shard((Mode[unit['mode']], unit['params'], Dist[unit['dist']], unit['arms'],
+                                      unit['steps'], unit['size'], seed))
+            finally:
+                stop.set()
+                keeper.join()
+            self.complete(unit, partials)
+            done += 1
+        return done
+
+    def reduce(self, spec, cache=None):
+        """
+        Merges the finished units of a sweep, per configuration in shard order
+        :param spec: the sweep spec, see expand
+        :param cache: Optional ResultCache in which complete configurations are stored, so Runner.run_experiment
+        and main serve them from the cache
+        :returns dict from configuration key to (number of units, number of finished units, tuple of Aggregators for
+        average reward, accuracy, score and accuracy score)
+        """
+        results = {}
+        for unit in expand(spec):
+            key = config_key(unit)
+            if key not in results:
+                results[key] = [0, 0, tuple(Aggregator(unit['steps'] if i < 2 else ()) for i in range(len(PARTS)))]
+            result = results[key]
+            result[0] += 1
+            path = self.path('done', unit['id'], '.npz')
+            if not os.path.exists(path):
+                continue
+            result[1] += 1
+            with np.load(path) as saved:
+                for name, aggregator in zip(PARTS, result[2]):
+                    aggregator.merge_moments(int(saved[name + '_count']), saved[name + '_mean'], saved[name + '_m2'])
+
+        for key, (units, finished, aggregators) in results.items():
+            if cache is not None and finished == units:
+                mode, params, dist, k, steps, seed = json.loads(key)
+                cache.store(cache.key(Mode[mode], params, Dist[dist], k, steps, seed), *aggregators[:2])
+        return {key: tuple(result) for key, result in results.items()}
+
+
+def work(directory, lease_seconds):
+    """
+    Entry point of one worker process
+    :param directory: Root directory of the queue
+    :param lease_seconds: Seconds after which a lease expires
+    :returns number of units run
+    """
+    return JobQueue(directory, lease_seconds=lease_seconds).work()
+
+
+def main():
+    """
+    Command line interface: submit a sweep spec, run workers, show progress and reduce the results
+    """
+    parser = argparse.ArgumentParser(description="File-backed job queue for sweeps over several machines.")
+    parser.add_argument('command', choices=['submit', 'work', 'status', 'reduce'])
+    parser.add_argument('--queue', default='queue', help="directory of the queue, shared by all workers")
+    parser.add_argument('--spec', help="JSON sweep spec (submit, reduce)")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes on this machine (work)")
+    parser.add_argument('--lease', type=float, default=600, help="seconds after which a lease expires")
+    parser.add_argument('--cache', default=None, help="ResultCache directory for complete configurations (reduce)")
+    args = parser.parse_args()
+
+    spec = None
+    if args.command in ('submit', 'reduce'):
+        with open(args.spec) as f:
+            spec = json.load(f)
+        try:
+            expand(spec)
+        except ValueError as error:
+            parser.error(str(error))
+
+    queue = JobQueue(args.queue, lease_seconds=args.lease)
+    match args.command:
+        case 'submit':
+            print("Added {} units".format(queue.submit(spec)))
+        case 'work':
+            if args.processes == 1:
+                print("Ran {} units".format(queue.work()))
+            else:
+                with ProcessPoolExecutor(max_workers=args.processes) as executor:
+                    runs = [executor.submit(work, args.queue, args.lease) for _ in range(args.processes)]
+                    print("Ran {} units".format(sum(run.result() for run in runs)))
+        case 'status':
+            print(queue.status())
+        case 'reduce':
+            cache = ResultCache(args.cache) if args.cache else None
+            for key, (units, finished, aggregators) in queue.reduce(spec, cache).items():
+                rewards, accuracies = aggregators[:2]
+                print("{}:\t{}/{} units\treward {} +- {}\taccuracy {}".format(
+                    key, finished, units, round(float(rewards.mean[-1]), 4), round(float(rewards.ci()[-1]), 4),
+                    round(float(accuracies.mean[-1]), 4)))
+
+
+if __name__ == "__main__":
+    main()
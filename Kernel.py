@@ -0,0 +1,264 @@
+import math
+
+import numpy as np
+
+from Agent import Mode, DISCOUNT_LIMIT, THOMPSON_STDEV, UCB_TOLERANCE
+from Problem import Problem, Dist
+
+try:
+    from numba import njit
+    COMPILED = True
+except ImportError:  # numba is optional, Agent.run is used without it
+    COMPILED = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit that leaves the function as it is
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+# modes and distributions as plain integers for the compiled kernel
+GREEDY = Mode.GREEDY.value
+EPSILON_GREEDY = Mode.EPSILON_GREEDY.value
+OPTIMISTIC = Mode.OPTIMISTIC.value
+SOFTMAX = Mode.SOFTMAX.value
+UCB = Mode.UCB.value
+ACTION_PREFERENCES = Mode.ACTION_PREFERENCES.value
+THOMPSON = Mode.THOMPSON.value
+DISCOUNTED_UCB = Mode.DISCOUNTED_UCB.value
+SW_UCB = Mode.SW_UCB.value
+GAUSS = Dist.GAUSS.value
+
+
+@njit(cache=True)
+def best_arm(scores, z):
+    """
+    Selects one of the arms with the highest score, uniformly at random like MaxTree.best
+    :param scores: score per arm
+    :param z: uniform random value in [0, 1)
+    :returns the arm
+    """
+    best = scores.max()
+    ties = 0
+    for a in range(len(scores)):
+        if scores[a] == best:
+            ties += 1
+    pick = int(z * ties)
+    for a in range(len(scores)):
+        if scores[a] == best:
+            if pick == 0:
+                return a
+            pick -= 1
+    return len(scores) - 1
+
+
+@njit(cache=True)
+def softmax_sample(logits, pi, z):
+    """
+    Writes the softmax of the logits to pi and samples an arm from it
+    :param logits: logit per arm
+    :param pi: output array for the probability of every arm
+    :param z: uniform random value in [0, 1)
+    :returns the arm
+    """
+    shift = logits.max()
+    total = 0.0
+    for a in range(len(logits)):
+        pi[a] = math.exp(logits[a] - shift)
+        total += pi[a]
+    selected = len(logits) - 1
+    cum_prob = 0.0
+    for a in range(len(logits)):
+        pi[a] /= total
+        cum_prob += pi[a]
+        if cum_prob > z:
+            selected = min(selected, a)
+    return selected
+
+
+@njit(cache=True)
+def play(mode, dist, means, stdevs, best, estimations, uncertainties, H, posterior, counts, sums, window_arms,
+         window_rewards, scores, epsilon, ucb_c, alpha, tau, gamma, step_size, window, first_step, start_step, steps,
+         total_reward, counter_selected_best, discount, average_rewards, accuracy, rng):
+    """
+    Plays steps time steps of one agent on a stationary problem in one call, with selection, reward and update fused
+    per step. Same rules as Agent, all random numbers are drawn from rng.
+    :param mode: Mode value
+    :param dist: Dist value
+    :param means: mean reward (Gaussian) or reward probability (Bernoulli) per arm
+    :param stdevs: standard deviation per arm (Gaussian)
+    :param best: mask of the best arms
+    :param estimations: Qt(a), updated in place (as are uncertainties, H, posterior, counts, sums and the window)
+    :param uncertainties: Na(t) for UCB
+    :param H: Ht(a) for action preferences
+    :param posterior: posterior per arm for Thompson sampling
+    :param counts: discounted or windowed counts for the non-stationary UCB modes
+    :param sums: discounted or windowed reward sums for the non-stationary UCB modes
+    :param window_arms: ring buffer of arms for SW_UCB
+    :param window_rewards: ring buffer of rewards for SW_UCB
+    :param scores: scratch array with one value per arm
+    :param step_size: constant step size, 0 for the sample average 1 / t
+    :param first_step: time step of the first played step
+    :param start_step: initial time step of the agent
+    :param steps: number of steps to play
+    :param average_rewards: history buffer written from index step - start_step on (empty for no history)
+    :param accuracy: history buffer like average_rewards
+    :param rng: numpy Generator
+    :returns total reward, number of best arms selected and the discount factor after the steps
+    """
+    k = len(means)
+    ucb_scale = -1.0  # below every scale, so the UCB scores are computed on the first step, also for ucb_c = 0
+    for step in range(first_step, first_step + steps):
+        # select
+        if mode == SOFTMAX:
+            for a in range(k):
+                scores[a] = estimations[a] / tau
+            arm = softmax_sample(scores, scores, rng.random())
+        elif mode == ACTION_PREFERENCES:
+            arm = softmax_sample(H, scores, rng.random())  # scores keeps pi for the update
+        elif mode == UCB:
+            if ucb_c * math.sqrt(math.log(step)) > ucb_scale * (1 + UCB_TOLERANCE):
+                ucb_scale = ucb_c * math.sqrt(math.log(step))
+                for a in range(k):
+                    scores[a] = round(estimations[a] + ucb_scale / math.sqrt(uncertainties[a]), 1)
+            arm = best_arm(scores, rng.random())
+        elif mode == THOMPSON:
+            for a in range(k):
+                if dist == GAUSS:
+                    scores[a] = rng.normal(posterior[0, a], 1 / math.sqrt(posterior[1, a]))
+                else:
+                    scores[a] = rng.beta(posterior[0, a], posterior[1, a])
+            arm = int(np.argmax(scores))
+        elif mode == DISCOUNTED_UCB or mode == SW_UCB:
+            if mode == DISCOUNTED_UCB:
+                total = counts.sum() / discount
+            else:
+                total = float(min(step - start_step, window))
+            bonus = math.log(max(total, 1))
+            for a in range(k):
+                count = counts[a] / discount if mode == DISCOUNTED_UCB else counts[a]
+                scores[a] = math.inf if count <= 0 else sums[a] / counts[a] + ucb_c * math.sqrt(bonus / count)
+            arm = best_arm(scores, rng.random())
+        elif mode == EPSILON_GREEDY and rng.uniform(0, 1) <= epsilon:
+            arm = rng.integers(0, k)
+        else:
+            arm = best_arm(estimations, rng.random())
+
+        # pull
+        if dist == GAUSS:
+            reward = min(max(rng.normal(means[arm], stdevs[arm]), 0.0), 1.0)
+        else:
+            reward = 1.0 if rng.uniform(0, 1) < means[arm] else 0.0
+        total_reward += reward
+        if best[arm]:
+            counter_selected_best += 1
+        played = step - start_step
+        if len(average_rewards) > 0:
+            average_rewards[played] = total_reward / step
+            accuracy[played] = counter_selected_best / step
+
+        # update
+        if step_size > 0:
+            estimations[arm] += step_size * (reward - estimations[arm])
+        else:
+            estimations[arm] += (reward - estimations[arm]) / step
+        if mode == UCB:
+            uncertainties[arm] += 1
+            scores[arm] = round(estimations[arm] + ucb_scale / math.sqrt(uncertainties[arm]), 1)
+        elif mode == ACTION_PREFERENCES:
+            regret = reward - total_reward / step
+            for a in range(k):
+                H[a] -= alpha * regret * scores[a]
+            H[arm] += alpha * regret
+        elif mode == THOMPSON:
+            if dist == GAUSS:
+                updated = posterior[1, arm] + 1 / THOMPSON_STDEV ** 2
+                posterior[0, arm] = (posterior[0, arm] * posterior[1, arm] + reward / THOMPSON_STDEV ** 2) / updated
+                posterior[1, arm] = updated
+            else:
+                posterior[0, arm] += reward
+                posterior[1, arm] += 1 - reward
+        elif mode == DISCOUNTED_UCB:
+            discount /= gamma
+            if discount > DISCOUNT_LIMIT:
+                counts /= discount
+                sums /= discount
+                discount = 1.0
+            counts[arm] += discount
+            sums[arm] += discount * reward
+        elif mode == SW_UCB:
+            position = played % window
+            if played >= window:
+                counts[window_arms[position]] -= 1
+                sums[window_arms[position]] -= window_rewards[position]
+            window_arms[position] = arm
+            window_rewards[position] = reward
+            counts[arm] += 1
+            sums[arm] += reward
+    return total_reward, counter_selected_best, discount
+
+
+def supported(agent):
+    """
+    :param agent: the Agent
+    :returns whether the agent can be run by the compiled kernel: numba is installed, no Probe is attached, and the
+    problem is a stationary Problem
+    """
+    return COMPILED and agent.probe is None and type(agent.env) is Problem
+
+
+def run(agent, max_steps=1000, history=True):
+    """
+    Runs an agent for max_steps steps in one compiled call, for single long runs where Agent.run is bound by the
+    Python overhead per step. The statistics are those of Agent.run, but the random numbers come from a numpy
+    Generator seeded from the agent's rng, so the trajectory is not the same. The agent can be run further with
+    Agent.run or saved with Checkpoint afterwards. Without numba, or for agents the kernel does not support, the
+    steps are played by Agent.run or Agent.iter_run.
+    :param agent: the Agent
+    :param max_steps: Number of steps
+    :param history: If True, the average reward and accuracy of every step are recorded like Agent.run, otherwise
+    only the totals are kept, like Agent.iter_run
+    """
+    if not supported(agent):
+        if history:
+            agent.run(max_steps=max_steps)
+        else:
+            for _ in agent.iter_run(agent.step - agent.start_step + max_steps):
+                pass
+        return
+
+    env = agent.env
+    k = env.arms
+    if history:
+        agent.reserve(max_steps)
+        average_rewards, accuracy = agent.average_rewards, agent.accuracy
+    else:
+        average_rewards = accuracy = np.zeros(0, dtype=np.float32)
+    empty = np.zeros(0)
+    agent.total_reward, agent.counter_selected_best, agent.discount = play(
+        agent.mode.value, env.dist_type.value, env.means, env.stdevs if env.stdevs is not None else np.zeros(k),
+        env.best, agent.estimations,
+        agent.uncertainties if agent.uncertainties is not None else np.zeros(0, dtype=np.int64),
+        agent.H if agent.H is not None else empty,
+        agent.posterior if agent.posterior is not None else np.zeros((2, 0)),
+        agent.counts if agent.counts is not None else empty, agent.sums if agent.sums is not None else empty,
+        agent.window_arms if agent.window_arms is not None else np.zeros(0, dtype=np.int64),
+        agent.window_rewards if agent.window_rewards is not None else empty, np.empty(k),
+        float(agent.epsilon), float(agent.ucb_c), float(agent.alpha), float(agent.tau), float(agent.gamma),
+        float(agent.step_size or 0), int(agent.window), agent.step, agent.start_step, max_steps,
+        float(agent.total_reward), int(agent.counter_selected_best), float(agent.discount), average_rewards, accuracy,
+        np.random.default_rng(agent.rng.getrandbits(64)))
+    agent.step += max_steps
+
+    # the trees of the agent are rebuilt from the updated arrays
+    match agent.mode:
+        case Mode.UCB:
+            agent.refresh_ucb_scores()
+        case Mode.SOFTMAX:
+            agent.policy.rebuild((agent.estimations / agent.tau).tolist())
+        case Mode.ACTION_PREFERENCES:
+            agent.policy.rebuild(agent.H.tolist())
+        case Mode.GREEDY | Mode.EPSILON_GREEDY | Mode.OPTIMISTIC:
+            agent.index.rebuild(agent.estimations.tolist())
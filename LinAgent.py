@@ -0,0 +1,152 @@
+import sys
+from enum import Enum
+
+import numpy as np
+
+
+class LinMode(Enum):
+    """
+    Enum to represent selection mode/algorithm for contextual bandits
+    """
+    UCB = 0
+    THOMPSON = 1
+
+
+class LinAgent:
+    __slots__ = ('env', 'mode', 'rng', 'shared', 'step', 'average_rewards', 'accuracy', 'total_reward',
+                 'counter_selected_best', 'A_inv', 'root', 'b', 'theta', 'ucb_c', 'scale')
+
+    def __init__(self, env, mode=LinMode.UCB, ucb_c=1.0, scale=0.2, reg=1.0, rng=None):
+        """
+        Agent for the contextual bandit with a linear reward model (LinUCB and linear Thompson sampling). The ridge
+        regression estimate theta = A^-1 b is kept per arm for the disjoint model and once for the shared model. A^-1
+        is updated by a rank-one Sherman-Morrison step, so an update costs O(d^2) instead of the O(d^3) of an
+        inversion, and all arms are scored with one batched matrix product.
+        :param env: the ContextualProblem
+        :param mode: selected algorithm
+        :param ucb_c: width of the confidence bound for LinUCB
+        :param scale: scale of the posterior for linear Thompson sampling, around the reward standard deviation
+        :param reg: ridge regularization, A starts as reg * I
+        :param rng: numpy Generator used for the Thompson draws (a fresh one by default)
+        """
+        self.env = env
+        self.mode = mode
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.shared = env.shared
+
+        self.step = 1
+        # float32 history buffers, allocated by run() for all its steps and written by index
+        self.average_rewards = np.zeros(0, dtype=np.float32)
+        self.accuracy = np.zeros(0, dtype=np.float32)
+        self.total_reward = 0
+        self.counter_selected_best = 0
+
+        # A^-1, b and theta = A^-1 b, with a leading arm axis for the disjoint model
+        arms = () if self.shared else (env.arms,)
+        self.A_inv = np.broadcast_to(np.eye(env.dim) / reg, arms + (env.dim, env.dim)).copy()
+        self.b = np.zeros(arms + (env.dim,))
+        self.theta = np.zeros(arms + (env.dim,))
+        # square root R of A^-1 = R R^T for the Thompson draws of the shared model, also updated in O(d^2)
+        self.root = np.eye(env.dim) / np.sqrt(reg) if self.shared else None
+
+        # hyperparameters:
+        self.ucb_c = ucb_c
+        self.scale = scale
+
+    def run(self, max_steps=1000):
+        """
+        Runs the agent on the problem
+        :param max_steps: Max number of epochs
+        """
+        played = self.step - 1
+        if played + max_steps > len(self.average_rewards):
+            self.average_rewards = np.resize(self.average_rewards, played + max_steps)
+            self.accuracy = np.resize(self.accuracy, played + max_steps)
+        for self.step in range(self.step, self.step + max_steps):
+            context = self.env.next_context()
+            arm = self.select_action(context)
+            reward, is_best = self.env.pull_arm(arm)
+            self.total_reward += reward
+            self.counter_selected_best += is_best
+            self.average_rewards[self.step - 1] = self.total_reward / self.step
+            self.accuracy[self.step - 1] = self.counter_selected_best / self.step
+            self.update_parameters(context, arm, reward)
+        self.step += 1
+
+    def select_action(self, context):
+        """
+        Calls appropriate action selection method based on mode.
+        :param context: the context of this step
+        :returns the selected arm
+        """
+        match self.mode:
+            case LinMode.UCB:
+                selected_arm = self.lin_ucb(context)
+            case LinMode.THOMPSON:
+                selected_arm = self.lin_thompson(context)
+            case _:
+                sys.exit("Invalid selection mode selected!")
+        return selected_arm
+
+    def scores(self, context):
+        """
+        Estimated reward and its variance x^T A^-1 x for every arm, for all arms at once
+        :param context: the context of this step
+        :returns means and variances, both (k,)
+        """
+        if self.shared:  # context (k, d): one A^-1 for the features of all arms
+            means = context @ self.theta
+            variances = np.einsum('ai,ij,aj->a', context, self.A_inv, context, optimize=True)
+        else:  # context (d,): one A^-1 per arm
+            means = self.theta @ context
+            variances = (self.A_inv @ context) @ context
+        return means, np.maximum(variances, 0)
+
+    def lin_ucb(self, context):
+        """
+        Selects action for LinUCB: highest upper confidence bound x^T theta + c * sqrt(x^T A^-1 x)
+        :param context: the context of this step
+        :returns selected action
+        """
+        means, variances = self.scores(context)
+        return int(np.argmax(means + self.ucb_c * np.sqrt(variances)))
+
+    def lin_thompson(self, context):
+        """
+        Selects action for linear Thompson sampling: theta is drawn from N(theta, scale^2 A^-1) and the arm with the
+        highest reward under the drawn theta is selected. With disjoint models the arms are independent, so the
+        reward of every arm is drawn directly from its one-dimensional marginal; the shared model draws one theta as
+        theta + scale * R z with the square root R of A^-1, in O(d^2).
+        :param context: the context of this step
+        :returns selected action
+        """
+        if self.shared:
+            theta = self.theta + self.scale * (self.root @ self.rng.standard_normal(self.env.dim))
+            return int(np.argmax(context @ theta))
+        means, variances = self.scores(context)
+        return int(np.argmax(means + self.scale * np.sqrt(variances) * self.rng.standard_normal(self.env.arms)))
+
+    def update_parameters(self, context, arm, reward):
+        """
+        Adds the observation to the ridge regression of the selected arm (disjoint) or of all arms (shared), with a
+        Sherman-Morrison update (A + x x^T)^-1 = A^-1 - A^-1 x x^T A^-1 / (1 + x^T A^-1 x). With v = R^T x this is
+        R (I - v v^T / (1 + v^T v)) R^T = R (I - beta v v^T)^2 R^T for beta = 1 / (s (1 + s)) with s = sqrt(1 + v^T v),
+        so the square root R of the shared model becomes R - beta (R v) v^T, also a rank-one step.
+        :param context: the context of this step
+        :param arm: selected arm
+        :param reward: obtained reward
+        """
+        if self.shared:
+            x = context[arm]
+            A_inv, b, theta = self.A_inv, self.b, self.theta
+        else:
+            x = context
+            A_inv, b, theta = self.A_inv[arm], self.b[arm], self.theta[arm]
+        u = A_inv @ x
+        A_inv -= np.outer(u, u / (1 + x @ u))
+        if self.root is not None:
+            v = x @ self.root
+            root = np.sqrt(1 + v @ v)
+            self.root -= np.outer(self.root @ v, v / (root * (1 + root)))
+        b += reward * x
+        theta[:] = A_inv @ b
@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+
+# trees with at most this many leaves are rebuilt in plain Python, which is faster than numpy for few arms
+SMALL_TREE = 64
+
+
+class MaxTree:
+    __slots__ = ('arms', 'size', 'values', 'counts')
+
+    def __init__(self, values):
+        """
+        Segment tree in which every node holds the maximum of its leaves and the number of leaves with that maximum.
+        Changing one value and drawing one of the maximal indices uniformly at random both take O(log k).
+        :param values: value per index
+        """
+        self.arms = len(values)
+        self.size = 1  # number of leaves, smallest power of 2 that fits all values
+        while self.size < self.arms:
+            self.size *= 2
+        self.values = None
+        self.counts = None  # number of leaves below the node with its maximum
+        self.rebuild(values)
+
+    def rebuild(self, values):
+        """
+        Replaces all values in O(k), one level of the tree at a time with numpy for large trees
+        :param values: value per index
+        """
+        if self.size <= SMALL_TREE:
+            self.values = [-math.inf] * (2 * self.size)
+            self.counts = [0] * (2 * self.size)
+            self.values[self.size:self.size + self.arms] = [float(v) for v in values]
+            self.counts[self.size:self.size + self.arms] = [1] * self.arms
+            for i in range(self.size - 1, 0, -1):
+                self.combine(i)
+            return
+
+        tree_values = np.full(2 * self.size, -math.inf)
+        tree_counts = np.zeros(2 * self.size, dtype=int)
+        tree_values[self.size:self.size + self.arms] = values
+        tree_counts[self.size:self.size + self.arms] = 1
+        n = self.size  # first node of the level below
+        while n > 1:
+            left, right = tree_values[n:2 * n:2], tree_values[n + 1:2 * n:2]
+            left_counts, right_counts = tree_counts[n:2 * n:2], tree_counts[n + 1:2 * n:2]
+            tree_values[n // 2:n] = np.maximum(left, right)
+            tree_counts[n // 2:n] = np.where(left > right, left_counts,
+                                             np.where(right > left, right_counts, left_counts + right_counts))
+            n //= 2
+        # plain lists are faster than numpy arrays for the single-element updates
+        self.values = tree_values.tolist()
+        self.counts = tree_counts.tolist()
+
+    def combine(self, i):
+        """
+        Recomputes the maximum and tie count of a node from its children
+        :param i: Node
+        """
+        values, counts = self.values, self.counts
+        left, right = values[2 * i], values[2 * i + 1]
+        if left > right:
+            values[i], counts[i] = left, counts[2 * i]
+        elif right > left:
+            values[i], counts[i] = right, counts[2 * i + 1]
+        else:
+            values[i], counts[i] = left, counts[2 * i] + counts[2 * i + 1]
+
+    def update(self, i, value):
+        """
+        Changes one value
+        :param i: Index
+        :param value: New value
+        """
+        i += self.size
+        self.values[i] = value
+        i //= 2
+        while i:
+            self.combine(i)
+            i //= 2
+
+    def max(self):
+        """
+        :returns highest value
+        """
+        return self.values[1]
+
+    def best(self, z):
+        """
+        Selects one of the indices with the highest value, uniformly at random
+        :param z: uniform random value in [0, 1)
+        :returns the index
+        """
+        values, counts = self.values, self.counts
+        best = values[1]
+        pick = z * counts[1]  # position among the tied indices
+        i = 1
+        while i < self.size:
+            left = counts[2 * i] if values[2 * i] == best else 0
+            if pick < left:
+                i = 2 * i
+            else:
+                pick -= left
+                i = 2 * i + 1
+        return i - self.size
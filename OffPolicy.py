@@ -0,0 +1,183 @@
+import numpy as np
+
+from Aggregator import Aggregator
+from Problem import Dist
+
+# events read from a log at a time, bounds the memory of replay and evaluation
+CHUNK_SIZE = 1 << 20
+
+
+def log_dtype(d=0):
+    """
+    :param d: Dimension of the contexts, 0 for logs of context-free problems
+    :returns numpy dtype of one logged event
+    """
+    fields = [('arm', np.int32), ('reward', np.float32), ('propensity', np.float32)]
+    if d > 0:
+        fields.insert(0, ('context', np.float32, (d,)))
+    return np.dtype(fields)
+
+
+def create_log(path, n, d=0):
+    """
+    Creates a memory-mapped .npy log of n events, to be filled chunk by chunk
+    :param path: .npy file
+    :param n: Number of events
+    :param d: Dimension of the contexts, 0 for logs of context-free problems
+    :returns the writable memory map
+    """
+    return np.lib.format.open_memmap(path, mode='w+', dtype=log_dtype(d), shape=(n,))
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Streams a log without loading it into memory
+    :param path: .npy file written by create_log
+    :param chunk_size: Number of events per chunk
+    :returns generator of structured arrays of at most chunk_size events
+    """
+    log = np.load(path, mmap_mode='r')
+    for start in range(0, len(log), chunk_size):
+        yield log[start:start + chunk_size]
+
+
+def log_uniform(path, env, n, rng=None, chunk_size=CHUNK_SIZE):
+    """
+    Logs n events of a uniformly random logging policy on a Problem, e.g. to test evaluation against simulation
+    :param path: .npy file
+    :param env: the Problem (context-free)
+    :param n: Number of events
+    :param rng: numpy Generator used for all random draws (a fresh one by default)
+    :param chunk_size: Number of events generated at a time
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    log = create_log(path, n)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        arms = rng.integers(0, env.arms, size=size)
+        if env.dist_type == Dist.GAUSS:
+            rewards = np.clip(rng.normal(env.means[arms], env.stdevs[arms]), 0, 1)
+        else:
+            rewards = (rng.random(size) < env.means[arms]).astype(float)
+        chunk = log[start:start + size]
+        chunk['arm'] = arms
+        chunk['reward'] = rewards
+        chunk['propensity'] = 1 / env.arms
+    log.flush()
+    del log
+
+
+def replay(agent, path, chunk_size=CHUNK_SIZE):
+    """
+    Rejection sampling replay (Li et al., 2011): the agent picks an arm for every logged event, and only events where
+    it picks the logged arm are shown to it, as if it had played them. Unbiased for logs of a uniformly random
+    logging policy. Works for Agent on context-free logs and LinAgent on contextual logs. No history is kept.
+    :param agent: the Agent or LinAgent, it learns from the accepted events
+    :param path: .npy file written by create_log
+    :param chunk_size: Number of events read at a time
+    :returns number of accepted events and the average reward over them
+    """
+    accepted = 0
+    total_reward = 0.0
+    for chunk in read_chunks(path, chunk_size):
+        contexts = chunk['context'] if 'context' in chunk.dtype.names else None
+        arms = chunk['arm'].tolist()
+        rewards = chunk['reward'].tolist()
+        for i in range(len(arms)):
+            if contexts is None:
+                if agent.select_action() != arms[i]:
+                    continue
+                agent.total_reward += rewards[i]
+                agent.update_parameters(arms[i], rewards[i])
+            else:
+                context = contexts[i]
+                if agent.select_action(context) != arms[i]:
+                    continue
+                agent.total_reward += rewards[i]
+                agent.update_parameters(context, arms[i], rewards[i])
+            agent.step += 1
+            accepted += 1
+            total_reward += rewards[i]
+    return accepted, total_reward / max(accepted, 1)
+
+
+def action_probabilities(agent, draws=10000):
+    """
+    Estimates the action distribution of a frozen Agent by drawing from its selection method, which is exact for the
+    deterministic modes and works for every Mode. The agent is not updated.
+    :param agent: the Agent
+    :param draws: Number of selections
+    :returns probability of every arm
+    """
+    counts = np.bincount([agent.select_action() for _ in range(draws)], minlength=agent.env.arms)
+    return counts / draws
+
+
+def arm_means(path, k, chunk_size=CHUNK_SIZE):
+    """
+    Reward model for doubly robust estimation on context-free logs: the average logged reward of every arm
+    :param path: .npy file written by create_log
+    :param k: Number of arms
+    :param chunk_size: Number of events read at a time
+    :returns average reward per arm (0 for arms that were never logged)
+    """
+    sums = np.zeros(k)
+    counts = np.zeros(k)
+    for chunk in read_chunks(path, chunk_size):
+        sums += np.bincount(chunk['arm'], weights=chunk['reward'], minlength=k)
+        counts += np.bincount(chunk['arm'], minlength=k)
+    return sums / np.maximum(counts, 1)
+
+
+def evaluate(path, target, model=None, chunk_size=CHUNK_SIZE):
+    """
+    Off-policy estimates of the average reward of a fixed target policy from a log, vectorized over every chunk:
+    - IPS: mean of w * r, with importance weight w = target(a | x) / propensity
+    - SNIPS: sum(w * r) / sum(w)
+    - DR: mean of q(x, target) + w * (r - q(x, a)), with reward model q
+    :param path: .npy file written by create_log
+    :param target: probability of every arm as a (k,) array, or a function from a chunk of events to the (n, k)
+    probabilities of the arms for every event, e.g. for contextual logs
+    :param model: predicted reward of every arm as a (k,) array, or a function from a chunk to (n, k) predictions
+    (arm_means of the log by default, only for context-free logs; the number of arms is taken from the target)
+    :param chunk_size: Number of events read at a time
+    :returns dict with the number of events and the IPS, SNIPS and DR estimates with the half widths of their 95%
+    confidence intervals (delta method for SNIPS)
+    :raises ValueError: if no model is given for a contextual log
+    """
+    if model is None:
+        if callable(target):
+            first = next(read_chunks(path, chunk_size), None)
+            if first is not None and 'context' in first.dtype.names:
+                raise ValueError("evaluate needs a reward model for contextual logs")
+            k = target(first).shape[1] if first is not None and len(first) else 0
+        else:
+            k = len(target)
+        model = arm_means(path, k, chunk_size)
+    ips = Aggregator(())
+    dr = Aggregator(())
+    weight_sum = 0.0
+    squares = np.zeros(3)  # sums of w^2, w^2 * r and w^2 * r^2 for the variance of SNIPS
+    for chunk in read_chunks(path, chunk_size):
+        rows = np.arange(len(chunk))
+        arms = chunk['arm']
+        rewards = chunk['reward'].astype(float)
+        probabilities = target(chunk) if callable(target) else np.broadcast_to(target, (len(chunk), len(target)))
+        predictions = model(chunk) if callable(model) else np.broadcast_to(model, (len(chunk), len(model)))
+        w = probabilities[rows, arms] / chunk['propensity']
+        ips.add_batch(w * rewards)
+        dr.add_batch((probabilities * predictions).sum(axis=1) + w * (rewards - predictions[rows, arms]))
+        weight_sum += w.sum()
+        squares += [np.dot(w, w), np.dot(w * w, rewards), np.dot(w * w, rewards * rewards)]
+
+    n = max(ips.count, 1)
+    snips = float(ips.mean * n / weight_sum) if weight_sum > 0 else 0.0
+    # delta method: SNIPS - value is about mean(w * (r - value)) / mean(w)
+    spread = (squares[2] - 2 * snips * squares[1] + snips ** 2 * squares[0]) / n
+    snips_ci = 1.96 * np.sqrt(max(spread, 0) / n) / (weight_sum / n) if weight_sum > 0 else np.nan
+    return {
+        'events': ips.count,
+        'ips': float(ips.mean), 'ips_ci': float(ips.ci()),
+        'snips': snips, 'snips_ci': float(snips_ci),
+        'dr': float(dr.mean), 'dr_ci': float(dr.ci()),
+    }
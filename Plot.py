@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# max number of points drawn per curve, about the width of a figure in pixels
+WIDTH = 2000
+
+
+def decimate(curve, width=WIDTH):
+    """
+    Reduces a curve to about width points without hiding spikes: the steps are split into width / 2 buckets and
+    the minimum and maximum of every bucket are kept, in the order in which they occur
+    :param curve: value per time step
+    :param width: Max number of points
+    :returns time steps and values of the kept points
+    """
+    curve = np.asarray(curve)
+    steps = np.arange(len(curve))
+    buckets = max(width // 2, 1)
+    if len(curve) <= width:
+        return steps, curve
+    size = -(-len(curve) // buckets)  # steps per bucket, rounded up
+    padded = np.pad(curve, (0, size * buckets - len(curve)), mode='edge').reshape(buckets, size)
+    low, high = padded.argmin(axis=1), padded.argmax(axis=1)
+    kept = np.sort(np.stack([low, high], axis=1), axis=1) + np.arange(buckets)[:, None] * size
+    kept = np.minimum(kept.ravel(), len(curve) - 1)
+    return steps[kept], curve[kept]
+
+
+def envelope(lower, upper, width=WIDTH):
+    """
+    Reduces a band to about width / 2 points that still contain it: the minimum of the lower and the maximum of the
+    upper bound per bucket of steps
+    :param lower: lower bound per time step
+    :param upper: upper bound per time step
+    :param width: Max number of points of a curve, as for decimate
+    :returns first time step, lower and upper bound per bucket
+    """
+    buckets = max(width // 2, 1)
+    if len(lower) <= width:
+        return np.arange(len(lower)), lower, upper
+    size = -(-len(lower) // buckets)
+    starts = np.arange(0, len(lower), size)
+    return starts, np.minimum.reduceat(lower, starts), np.maximum.reduceat(upper, starts)
+
+
+def save_figure(path, title, xlabel, ylabel, labels, means, cis=None):
+    """
+    Stores the data of a figure, so it can be rendered later and again without rerunning the experiment
+    :param path: .npz file
+    :param title: Title of the figure
+    :param xlabel: Label of the x axis
+    :param ylabel: Label of the y axis
+    :param labels: Label per curve
+    :param means: Curve per label
+    :param cis: Half width of the confidence interval per label and step (None for no bands)
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    arrays = {'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'labels': np.array([str(l) for l in labels]),
+              'means': np.array(means)}
+    if cis is not None:
+        arrays['cis'] = np.array(cis)
+    np.savez(path, **arrays)
+
+
+def render(path, output=None, bands=True, width=WIDTH):
+    """
+    Renders a stored figure to an image with the non-interactive Agg backend. matplotlib is only imported here, so
+    runs that do not plot never load it.
+    :param path: .npz file written by save_figure
+    :param output: Image file (the .npz path with .png by default)
+    :param bands: If True, draws the confidence bands that were stored with the figure
+    :param width: Max number of points per curve
+    :returns path of the image
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    output = output or os.path.splitext(path)[0] + '.png'
+    with np.load(path) as figure:
+        fig = plt.figure(figsize=(10, 8))
+        for i, label in enumerate(figure['labels']):
+            line, = plt.plot(*decimate(figure['means'][i], width), label=label)
+            if bands and 'cis' in figure.files:
+                steps, low, high = envelope(figure['means'][i] - figure['cis'][i],
+                                            figure['means'][i] + figure['cis'][i], width)
+                plt.fill_between(steps, low, high, color=line.get_color(), alpha=0.2, linewidth=0, step='post')
+        plt.legend(loc='upper right')
+        plt.xlabel(str(figure['xlabel']))
+        plt.ylabel(str(figure['ylabel']))
+        plt.title(str(figure['title']))
+    fig.savefig(output)
+    plt.close(fig)
+    return output
+
+
+def render_all(paths, bands=True, width=WIDTH, workers=None):
+    """
+    Renders several stored figures in parallel, one process per figure
+    :param paths: .npz files written by save_figure
+    :param bands: If True, draws the stored confidence bands
+    :param width: Max number of points per curve
+    :param workers: Number of worker processes (all cores by default, 1 renders in this process)
+    :returns paths of the images
+    """
+    workers = min(workers or os.cpu_count(), len(paths))
+    if workers <= 1:
+        return [render(path, bands=bands, width=width) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render, paths, [None] * len(paths), [bands] * len(paths), [width] * len(paths)))
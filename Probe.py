@@ -0,0 +1,166 @@
+import cProfile
+import io
+import json
+import pstats
+from time import perf_counter
+
+import numpy as np
+
+# rng methods that do not draw random numbers
+STATE_METHODS = {'getstate', 'setstate', 'get_state', 'set_state', 'seed', 'bit_generator'}
+# rng methods whose positional arguments are a population, not parameters of a distribution
+POPULATION_METHODS = {'choice', 'choices', 'sample', 'shuffle', 'permutation', 'permuted'}
+
+
+def numbers_drawn(name, args, kwargs):
+    """
+    Number of random numbers one call of an rng method draws: the size (or k for the random module) if it is given,
+    otherwise one per element of the broadcast distribution parameters, e.g. one per arm for beta(a, b) with arrays
+    :param name: name of the method
+    :param args: positional arguments of the call
+    :param kwargs: keyword arguments of the call
+    :returns the number of random numbers
+    """
+    size = kwargs.get('size', kwargs.get('k'))
+    if size is None and name == 'random' and args:  # numpy random(size)
+        size = args[0]
+    if size is None and name == 'sample' and len(args) > 1:  # random.sample(population, k)
+        size = args[1]
+    if size is not None:
+        return int(np.prod(size))
+    if name in POPULATION_METHODS or not args:
+        return 1
+    return np.broadcast(*args).size
+
+
+class CountingRNG:
+    def __init__(self, rng):
+        """
+        Wraps a source of random numbers and counts the random numbers drawn from it, not the calls: an array draw
+        counts once per element
+        :param rng: the wrapped source, e.g. the random module or a numpy Generator
+        """
+        self.rng = rng
+        self.draws = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.rng, name)
+        if name in STATE_METHODS or not callable(attribute):
+            return attribute
+
+        def draw(*args, **kwargs):
+            self.draws += numbers_drawn(name, args, kwargs)
+            return attribute(*args, **kwargs)
+        return draw
+
+
+class Probe:
+    def __init__(self, profile=False):
+        """
+        Opt-in instrumentation of Agent.run. While attached to an agent, the run loop of the probe is used, which
+        times action selection, the environment and the parameter updates of every step separately, and the random
+        numbers drawn by the agent and its problem are counted. An agent without a probe pays nothing for it.
+        :param profile: If True, the run loop is also profiled with cProfile
+        """
+        self.time = {'select': 0.0, 'env': 0.0, 'update': 0.0}  # cumulative seconds per phase
+        self.calls = {'select': 0, 'env': 0, 'update': 0}
+        self.agent = None
+        self.agent_rng = None
+        self.env_rng = None
+        self.sampler_rng = None  # numpy Generator of Thompson sampling, if the agent has one
+        self.profiler = cProfile.Profile() if profile else None
+
+    def attach(self, agent):
+        """
+        Instruments an agent and its problem
+        :param agent: the Agent
+        """
+        self.agent = agent
+        self.agent_rng = CountingRNG(agent.rng)
+        self.env_rng = CountingRNG(agent.env.rng)
+        agent.rng = self.agent_rng
+        agent.env.rng = self.env_rng
+        if agent.sampler is not None:
+            self.sampler_rng = CountingRNG(agent.sampler)
+            agent.sampler = self.sampler_rng
+        agent.probe = self
+
+    def detach(self):
+        """
+        Restores the agent and its problem to their uninstrumented state
+        """
+        self.agent.rng = self.agent_rng.rng
+        self.agent.env.rng = self.env_rng.rng
+        if self.sampler_rng is not None:
+            self.agent.sampler = self.sampler_rng.rng
+        self.agent.probe = None
+
+    def run(self, agent, max_steps):
+        """
+        Instrumented copy of the run loop of Agent
+        :param agent: the Agent
+        :param max_steps: Max number of epochs
+        """
+        if self.profiler is not None:
+            self.profiler.enable()
+        time = self.time
+        agent.reserve(max_steps)
+        end = agent.step + max_steps
+        for agent.step in range(agent.step, end):
+            start = perf_counter()
+            arm = agent.select_action()
+            selected = perf_counter()
+            reward, is_best = agent.env.pull_arm(arm)
+            pulled = perf_counter()
+            agent.record(reward, is_best)
+            agent.update_parameters(arm, reward)
+            updated = perf_counter()
+            time['select'] += selected - start
+            time['env'] += pulled - selected
+            time['update'] += updated - pulled
+        agent.step = end
+        for phase in self.calls:
+            self.calls[phase] += max_steps
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def summary(self):
+        """
+        :returns dict with time and calls per phase and the number of random numbers drawn, split per Agent and per
+        Problem
+        """
+        return {
+            'mode': self.agent.mode.name,
+            'arms': self.agent.env.arms,
+            'steps': self.calls['select'],
+            'agent': {
+                'select_time': self.time['select'],
+                'select_calls': self.calls['select'],
+                'update_time': self.time['update'],
+                'update_calls': self.calls['update'],
+                'rng_draws': self.agent_rng.draws + (self.sampler_rng.draws if self.sampler_rng is not None else 0),
+            },
+            'problem': {
+                'pull_time': self.time['env'],
+                'pull_calls': self.calls['env'],
+                'rng_draws': self.env_rng.draws,
+            },
+        }
+
+    def to_json(self):
+        """
+        :returns the summary as a JSON string
+        """
+        return json.dumps(self.summary(), indent=2)
+
+    def profile_stats(self, limit=20, sort='cumulative'):
+        """
+        :param limit: Max number of functions
+        :param sort: pstats sort key
+        :returns the cProfile statistics of the run loop as text, None if profiling is off
+        """
+        if self.profiler is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -14,70 +14,82 @@ class Dist(Enum):
 
 
 class Problem:
-    def __init__(self, k, dist_type=Dist.GAUSS, verbose=False):
+    __slots__ = ('rng', 'arms', 'dist_type', 'verbose', 'means', 'stdevs', 'best_actions', 'best')
+
+    def __init__(self, k, dist_type=Dist.GAUSS, verbose=False, rng=None):
         """
         Initializes the multi-armed bandit problem object
         :param k: Number of arms
         :param dist_type: Reward distribution (Gaussian dist_type. by default)
         :param verbose: If True, prints additional information about the problem
+        :param rng: source of random numbers with the interface of numpy.random, e.g. a numpy Generator
+        (the numpy.random module by default)
         """
+        self.rng = rng if rng is not None else random
         self.arms = k  # number of arms
         self.dist_type = dist_type  # reward distribution type
         self.verbose = verbose
 
-        # initialize reward distributions
+        # initialize reward distributions, one float64 array per parameter
+        self.means = None  # mean reward (Gaussian) or reward probability (Bernoulli) for each arm
+        self.stdevs = None  # standard deviation for each arm, only for Gaussian distribution
         if dist_type == Dist.GAUSS:
-            self.reward_dists = []  # reward distributions for each arm
             self.generate_reward_dists()
         elif dist_type == Dist.BERNOULLI:
-            self.reward_dists = []  # reward probability for each arm
             self.generate_probabilities()
         else:
             # invalid distribution provided, exit
             sys.exit("Invalid distribution (dist_type = " + str(dist_type) + ") provided!")
 
+        # the arms never change, so the best ones are found once
+        self.best_actions = self.find_best_actions()
+        self.best = np.zeros(k, dtype=bool)  # mask of the best actions
+        self.best[self.best_actions] = True
+
         # prints arm distributions if required
         if self.verbose:
             self.print_arms()
 
+    @property
+    def reward_dists(self):
+        """
+        (mean, stdev) per arm for Gaussian distribution, reward probability per arm for Bernoulli distribution
+        """
+        if self.dist_type == Dist.GAUSS:
+            return list(zip(self.means.tolist(), self.stdevs.tolist()))
+        return self.means.tolist()
+
     def generate_reward_dists(self):
         """
         Generates reward distributions for each arm. Used for Gaussian distribution.
         """
-        for a in range(self.arms):
-            stdev = 0.2  # random.uniform(0, .3)
-            mean = random.uniform(.3, 1)
-            self.reward_dists.append((mean, stdev))
+        self.stdevs = np.full(self.arms, 0.2)  # random.uniform(0, .3)
+        self.means = np.asarray(self.rng.uniform(.3, 1, size=self.arms), dtype=np.float64)
 
     def generate_probabilities(self):
         """
         Generates reward probabilities for each arm. Used for Bernoulli distribution.
         """
-        for a in range(self.arms):
-            prob = random.uniform(0, 1)
-            self.reward_dists.append(prob)
+        self.means = np.asarray(self.rng.uniform(0, 1, size=self.arms), dtype=np.float64)
+
+    def find_best_actions(self):
+        """
+        Finds all actions with the highest reward / probability of a reward
+        :returns list of highest-reward actions
+        """
+        if self.dist_type == Dist.GAUSS:  # all arms with the same highest utility
+            best_actions = np.flatnonzero(self.means == self.means.max()).tolist()
+        else:  # bernoulli dist
+            best_actions = [int(np.argmax(self.means))]
+
+        return best_actions
 
     def best_action(self):
         """
         Returns one of the actions with the highest reward / probability of a reward
         :returns highest-reward action
         """
-        if self.dist_type == Dist.GAUSS:
-            best_actions = [0]
-            best_reward = self.reward_dists[0][0]
-
-            for arm in range(1, self.arms):
-                reward = self.reward_dists[arm][0]
-                if reward > best_reward:  # new highest utility arm
-                    best_actions = [arm]
-                    best_reward = reward
-                elif reward == best_reward:  # arm with same highest utility
-                    best_actions.append(arm)
-            best_option = random.choice(best_actions)
-        else:  # bernoulli dist
-            best_option = np.argmax(self.reward_dists)
-
-        return best_option
+        return self.rng.choice(self.best_actions)
 
     def print_arms(self):
         """
@@ -85,12 +97,11 @@ class Problem:
         """
         if self.dist_type == Dist.GAUSS:  # gaussian output
             for i in range(self.arms):
-                a = self.reward_dists[i]
-                mean, stdev = a
+                mean, stdev = self.means[i], self.stdevs[i]
                 print("ARM {}:\t MEAN: {},\t STD: {}".format(i, round(mean, 3), round(stdev, 3)))
         else:  # bernoulli distribution output
             for i in range(self.arms):
-                prob = self.reward_dists[i]
+                prob = self.means[i]
                 print("ARM {}:\t{}".format(i, round(prob, 3)))
 
     def pull_arm(self, a):
@@ -103,16 +114,14 @@ class Problem:
             return 0
         if self.dist_type == Dist.GAUSS:
             # Gaussian distribution
-            mean, stdev = self.reward_dists[a][0], self.reward_dists[a][1]
-            reward = random.normal(loc=mean, scale=stdev)
+            reward = self.rng.normal(loc=self.means[a], scale=self.stdevs[a])
             # limit reward to the 0 or 1
             if reward < 0:
                 reward = 0
             elif reward > 1:
                 reward = 1
         else:
-            prob = self.reward_dists[a]
-            reward = int(random.uniform(0, 1) < prob)
+            reward = int(self.rng.uniform(0, 1) < self.means[a])
 
-        is_best = 1 if a == self.best_action() else 0
+        is_best = 1 if self.best[a] else 0
         return reward, is_best
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Aggregator import Aggregator
+from BatchAgent import BatchAgent
+from BatchProblem import BatchProblem
+from Problem import Dist
+from HashedProblem import HashedProblem
+
+SHARD_SIZE = 100  # number of replicas simulated per work unit
+
+
+def run_shard(unit):
+    """
+    Runs one work unit: a batch of replicas of one configuration, seeded from its own SeedSequence
+    :param unit: tuple (mode, params, dist_type, k, steps, size, seed)
+    :returns Aggregators of the average reward curves, the accuracy curves, the replica scores (the average
+    reward over all time steps) and the replica accuracy scores (the accuracy averaged over all time steps) of the
+    shard
+    """
+    mode, params, dist_type, k, steps, size, seed = unit
+    env_seed, agent_seed = seed.spawn(2)
+    env = BatchProblem(size, k, dist_type=dist_type, rng=np.random.default_rng(env_seed))
+    agents = BatchAgent(env, mode=mode, rng=np.random.default_rng(agent_seed), **params)
+    agents.run(max_steps=steps, record=False)
+    score_stats = Aggregator(())
+    score_stats.add_batch(agents.scores)
+    accuracy_score_stats = Aggregator(())
+    accuracy_score_stats.add_batch(agents.accuracy_scores)
+    return agents.reward_stats, agents.accuracy_stats, score_stats, accuracy_score_stats
+
+
+def config_name(mode, params):
+    """
+    Canonical text representation of a configuration, independent of the order of the parameters
+    :param mode: selected algorithm
+    :param params: keyword arguments for the agent
+    :returns the representation
+    """
+    return json.dumps([mode.name, sorted((name, float(value)) for name, value in params.items())])
+
+
+def config_seed(seed, mode, params):
+    """
+    Derives the SeedSequence of a configuration from the master seed and the configuration itself, so the results
+    of a configuration do not depend on which other configurations are run with it
+    :param seed: Master seed (None for fresh entropy)
+    :param mode: selected algorithm
+    :param params: keyword arguments for the agent
+    :returns the SeedSequence
+    """
+    digest = hashlib.sha256(config_name(mode, params).encode()).digest()
+    spawn_key = tuple(int.from_bytes(digest[i:i + 4], 'little') for i in range(0, 16, 4))
+    return np.random.SeedSequence(seed, spawn_key=spawn_key)
+
+
+def shard_sizes(num, shard_size=SHARD_SIZE):
+    """
+    :param num: Number of replicas
+    :param shard_size: Max number of replicas per shard
+    :returns number of replicas per shard
+    """
+    sizes = [shard_size] * (num // shard_size)
+    if num % shard_size:
+        sizes.append(num % shard_size)
+    return sizes
+
+
+def make_units(configs, dist_type, k, num, steps, seeds, shard_size=SHARD_SIZE, first_shard=0):
+    """
+    Splits every configuration into shards of at most shard_size replicas. The shards of a configuration get seeds
+    spawned from the SeedSequence of that configuration, so the units only depend on the given seeds. Spawning again
+    from the same SeedSequences yields new, independent shards.
+    :param configs: list of (mode, params) tuples, params being keyword arguments for the agent
+    :param dist_type: Reward distribution type
+    :param k: Number of arms
+    :param num: Number of replicas per configuration
+    :param steps: Number of time steps per replica
+    :param seeds: SeedSequence per configuration
+    :param shard_size: Max number of replicas per shard
+    :param first_shard: Number of shards of every configuration that were run before and are skipped
+    :returns list of work units, grouped per configuration
+    """
+    sizes = shard_sizes(num, shard_size)
+    units = []
+    for (mode, params), seed in zip(configs, seeds):
+        seed.spawn(first_shard)
+        shard_seeds = seed.spawn(len(sizes))
+        units.append([(mode, params, dist_type, k, steps, size, s) for size, s in zip(sizes, shard_seeds)])
+    return units
+
+
+def run_units(units, workers=None, function=run_shard):
+    """
+    Runs grouped work units, in a pool of worker processes if more than one worker is used
+    :param units: list of work units per configuration, as made by make_units
+    :param workers: Number of worker processes (all cores by default, 1 runs in this process)
+    :param function: function that runs one work unit
+    :returns list of shard results per configuration, in shard order
+    """
+    flat_units = [unit for config_units in units for unit in config_units]
+
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        partials = list(map(function, flat_units))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(flat_units))) as executor:
+            partials = list(executor.map(function, flat_units))
+
+    grouped = []
+    for config_units in units:
+        grouped.append(partials[:len(config_units)])
+        partials = partials[len(config_units):]
+    return grouped
+
+
+def run_experiment(configs, dist_type=Dist.GAUSS, k=7, num=1000, steps=1000, seed=None, workers=None, cache=None):
+    """
+    Runs num replicas of every configuration, sharded over a pool of worker processes. Every configuration is seeded
+    from the master seed and its own parameters, and the shard statistics are merged in shard order, so the results
+    for a given master seed are identical for any number of workers.
+    :param configs: list of (mode, params) tuples, params being keyword arguments for the agent
+    :param dist_type: Reward distribution type
+    :param k: Number of arms
+    :param num: Number of replicas per configuration
+    :param steps: Number of time steps per replica
+    :param seed: Master seed (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default, 1 runs in this process)
+    :param cache: Optional ResultCache. Cached configurations are not run again and cached configurations with
+    fewer replicas are extended with the missing ones. Only used with a fixed master seed.
+    :returns list of (average reward, accuracy) Aggregators per configuration
+    """
+    if seed is None:
+        cache = None
+
+    results = [None] * len(configs)
+    todo = []  # (configuration index, replicas already cached)
+    for c, (mode, params) in enumerate(configs):
+        cached = 0
+        if cache is not None:
+            key = cache.key(mode, params, dist_type, k, steps, seed)
+            cached = cache.largest(key, num)
+            if cached:
+                results[c] = cache.load(key, cached)
+        if cached < num:
+            todo.append((c, cached))
+
+    # configurations are grouped by the number of replicas that were cached before
+    for cached in sorted({cached for _, cached in todo}):
+        group = [c for c, group_cached in todo if group_cached == cached]
+        group_configs = [configs[c] for c in group]
+        seeds = [config_seed(seed, mode, params) for mode, params in group_configs]
+        units = make_units(group_configs, dist_type, k, num - cached, steps, seeds,
+                           first_shard=cached // SHARD_SIZE)
+        for c, partials in zip(group, run_units(units, workers)):
+            rewards = Aggregator(steps)
+            accuracies = Aggregator(steps)
+            if results[c] is not None:
+                rewards.merge(results[c][0])
+                accuracies.merge(results[c][1])
+            for reward_stats, accuracy_stats, _, _ in partials:
+                rewards.merge(reward_stats)
+                accuracies.merge(accuracy_stats)
+            results[c] = (rewards, accuracies)
+            if cache is not None:
+                mode, params = configs[c]
+                cache.store(cache.key(mode, params, dist_type, k, steps, seed), rewards, accuracies)
+    return results
+
+
+def converged(stats, tolerance):
+    """
+    :param stats: (average reward, accuracy, score, accuracy score) Aggregators of one configuration
+    :param tolerance: Max half width of the 95% confidence intervals
+    :returns True if the CIs of the final average reward, the final accuracy and the areas under both curves are all
+    within the tolerance
+    """
+    rewards, accuracies, scores, accuracy_scores = stats
+    if rewards.count < 2:
+        return False
+    widths = [rewards.ci()[-1], accuracies.ci()[-1], scores.ci(), accuracy_scores.ci()]
+    return max(widths) <= tolerance
+
+
+def run_sequential(configs, dist_type=Dist.GAUSS, k=7, steps=1000, tolerance=0.005, batch=SHARD_SIZE, max_num=1000,
+                   seed=None, workers=None, seeds=None):
+    """
+    Sequential experiment: replicas are run in rounds of batch replicas per configuration, and a configuration stops
+    as soon as the 95% CIs of its final and area-under-curve average reward and accuracy are within the tolerance,
+    or after max_num replicas. Configurations that are easy to pin down stop early, close ones run up to max_num.
+    The CIs are not corrected for the repeated looks, so they are slightly optimistic. The replicas are the same as
+    those of run_experiment for the same seed, as long as batch is a multiple of SHARD_SIZE.
+    :param configs: list of (mode, params) tuples, params being keyword arguments for the agent
+    :param dist_type: Reward distribution type
+    :param k: Number of arms
+    :param steps: Number of time steps per replica
+    :param tolerance: Max half width of the confidence intervals
+    :param batch: Number of replicas per configuration and round
+    :param max_num: Max number of replicas per configuration
+    :param seed: Master seed (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default, 1 runs in this process)
+    :param seeds: SeedSequence per configuration, from which the shards are spawned (derived from the master seed
+    and the configuration by default)
+    :returns list of (average reward, accuracy, score, accuracy score) Aggregators per configuration, the number of
+    replicas run is their count
+    """
+    if seeds is None:
+        seeds = [config_seed(seed, mode, params) for mode, params in configs]
+    results = [(Aggregator(steps), Aggregator(steps), Aggregator(()), Aggregator(())) for _ in configs]
+    active = list(range(len(configs)))
+    while active:
+        num = min(batch, max_num - results[active[0]][0].count)
+        units = make_units([configs[c] for c in active], dist_type, k, num, steps, [seeds[c] for c in active])
+        for c, partials in zip(active, run_units(units, workers)):
+            for stats, partial in zip(results[c], zip(*partials)):
+                for shard_stats in partial:
+                    stats.merge(shard_stats)
+        # all active configurations have run the same number of replicas
+        active = [c for c in active if results[c][0].count < max_num and not converged(results[c], tolerance)]
+    return results
+
+
+def run_paired_shard(unit):
+    """
+    Runs one work unit of a common-random-numbers experiment: every configuration is run on the same problems, the
+    same hashed reward streams and the same action selection seed
+    :param unit: tuple (configs, dist_type, k, steps, size, seed)
+    :returns per configuration the Aggregators of its average reward curves, its accuracy curves and the paired
+    differences of its average reward curves with those of the first configuration
+    """
+    configs, dist_type, k, steps, size, seed = unit
+    env_seed, agent_seed = seed.spawn(2)
+    env = HashedProblem(size, k, dist_type=dist_type, rng=np.random.default_rng(env_seed))
+
+    results = []
+    reference = None
+    for mode, params in configs:
+        env.reset()
+        agents = BatchAgent(env, mode=mode, rng=np.random.default_rng(agent_seed), **params)
+        agents.run(max_steps=steps)
+        if reference is None:
+            reference = agents.average_rewards
+        differences = Aggregator(steps)
+        differences.add_batch(agents.average_rewards - reference)
+        results.append((agents.reward_stats, agents.accuracy_stats, differences))
+    return results
+
+
+def run_paired(configs, dist_type=Dist.GAUSS, k=7, num=1000, steps=1000, seed=None, workers=None):
+    """
+    Runs num replicas of every configuration with common random numbers: replica i of every configuration runs on
+    the same problem instance and sees the same reward for the j-th pull of an arm. The differences between
+    configurations then do not carry the variance between problem instances, so their confidence intervals are
+    much narrower than those of independent runs with the same number of replicas.
+    :param configs: list of (mode, params) tuples, params being keyword arguments for the agent. The first one is
+    the reference the others are compared with.
+    :param dist_type: Reward distribution type
+    :param k: Number of arms
+    :param num: Number of replicas per configuration
+    :param steps: Number of time steps per replica
+    :param seed: Master seed (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default, 1 runs in this process)
+    :returns list of (average reward, accuracy, paired difference with the reference) Aggregators per configuration
+    """
+    sizes = shard_sizes(num)
+    shard_seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    units = [[(configs, dist_type, k, steps, size, s) for size, s in zip(sizes, shard_seeds)]]
+
+    results = [(Aggregator(steps), Aggregator(steps), Aggregator(steps)) for _ in configs]
+    for shard in run_units(units, workers, function=run_paired_shard)[0]:
+        for aggregators, shard_aggregators in zip(results, shard):
+            for aggregator, shard_aggregator in zip(aggregators, shard_aggregators):
+                aggregator.merge(shard_aggregator)
+    return results
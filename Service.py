@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Agent import Agent, Mode
+from Problem import Problem, Dist
+
+
+class LiveBandit:
+    def __init__(self, k, dist_type=Dist.GAUSS):
+        """
+        Stand-in for Problem when the agent serves live traffic. The agent never pulls arms itself, rewards are
+        reported through PolicyService.observe.
+        :param k: Number of arms
+        :param dist_type: Kind of rewards the clients report, used by Thompson sampling
+        """
+        self.arms = k
+        self.dist_type = dist_type
+        self.rng = np.random
+
+    def pull_arm(self, a):
+        """
+        Live arms cannot be pulled by the agent
+        :param a: Action to perform / arm to pull
+        """
+        raise RuntimeError("Arms of a live bandit are pulled by the clients of the service")
+
+
+class PolicyService:
+    def __init__(self, k, mode=Mode.EPSILON_GREEDY, dist_type=Dist.GAUSS, batch_size=64, flush_interval=0.001,
+                 **params):
+        """
+        Online decision service around one Agent shared by all requests. select() answers from the current policy
+        without waiting, observe() only queues the reward; queued rewards are applied in micro-batches, when
+        batch_size of them are waiting or every flush_interval seconds. Everything runs on one event loop, so the
+        policy is never locked. Rewards may arrive in any order and long after their select().
+        :param k: Number of arms
+        :param mode: selected algorithm
+        :param dist_type: Kind of rewards the clients report: Bernoulli for 0/1 rewards such as clicks, Gaussian for
+        rewards in [0, 1]. Thompson sampling picks its posterior by it.
+        :param batch_size: Number of queued rewards that triggers an update
+        :param flush_interval: Max seconds a reward waits before it is applied
+        :param params: hyperparameters for the Agent
+        """
+        self.agent = Agent(LiveBandit(k, dist_type=dist_type), mode=mode, **params)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []  # (arm, reward) waiting for the next micro-batch
+        self.decisions = 0
+        self.observations = 0
+        self.flusher = None
+
+    async def start(self):
+        """
+        Starts applying queued rewards in the background
+        """
+        self.flusher = asyncio.create_task(self.flush_periodically())
+
+    async def stop(self):
+        """
+        Stops the background task and applies the rewards that are still queued
+        """
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            self.flusher = None
+        self.flush()
+
+    async def flush_periodically(self):
+        """
+        Applies the queued rewards every flush_interval seconds
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as error:  # a failed batch must not stop later updates
+                print("Failed to apply a batch of rewards:", repr(error))
+
+    async def select(self):
+        """
+        :returns the arm to pull for one request
+        """
+        self.decisions += 1
+        return self.agent.select_action()
+
+    async def observe(self, arm, reward):
+        """
+        Reports the reward of a pulled arm. Invalid observations are rejected before they are queued, so they cannot
+        break a batch.
+        :param arm: Pulled arm
+        :param reward: Obtained reward, in [0, 1] for Bernoulli rewards
+        :raises ValueError: if the arm does not exist or the reward is not a valid reward
+        """
+        env = self.agent.env
+        if not 0 <= arm < env.arms:
+            raise ValueError("arm " + str(arm) + " does not exist")
+        if not math.isfinite(reward) or (env.dist_type == Dist.BERNOULLI and not 0 <= reward <= 1):
+            raise ValueError("invalid reward " + str(reward))
+        self.pending.append((arm, reward))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Applies all queued rewards to the policy, in the same order as the steps of Agent.run
+        """
+        pending, self.pending = self.pending, []
+        agent = self.agent
+        for arm, reward in pending:
+            agent.total_reward += reward
+            agent.update_parameters(arm, reward)
+            agent.step += 1
+        self.observations += len(pending)
+
+
+async def handle_client(service, reader, writer, timings=None):
+    """
+    Serves one connection of the line protocol: "SELECT" is answered with an arm, "OBSERVE <arm> <reward>" with "OK",
+    and invalid requests with "ERROR <reason>"
+    :param service: the PolicyService
+    :param reader: stream of the connection
+    :param writer: stream of the connection
+    :param timings: Optional list to which the server-side time of every SELECT is appended, from the received line
+    to the answer handed to the socket
+    """
+    try:
+        while line := await reader.readline():
+            start = time.perf_counter()
+            command = line.split() or [b'']
+            if command[0] == b'SELECT':
+                writer.write(b'%d\n' % await service.select())
+                if timings is not None:
+                    timings.append(time.perf_counter() - start)
+            elif command[0] == b'OBSERVE':
+                try:
+                    if len(command) != 3:
+                        raise ValueError("expected OBSERVE <arm> <reward>")
+                    await service.observe(int(command[1]), float(command[2]))
+                    writer.write(b'OK\n')
+                except ValueError as error:
+                    writer.write(b'ERROR %s\n' % str(error).encode())
+            else:
+                writer.write(b'ERROR unknown command\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service, path, timings=None):
+    """
+    Serves a PolicyService on a Unix socket
+    :param service: the PolicyService
+    :param path: path of the socket
+    :param timings: Optional list to which the server-side time of every SELECT is appended
+    :returns the asyncio Server
+    """
+    return await asyncio.start_unix_server(lambda r, w: handle_client(service, r, w, timings), path=path)
+
+
+async def load_client(path, env, requests, latencies):
+    """
+    One simulated client: requests an arm, pulls it on its own problem and reports the reward
+    :param path: path of the socket
+    :param env: Problem from which the rewards are drawn
+    :param requests: Number of decisions
+    :param latencies: list to which the select round trip times are appended
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    for _ in range(requests):
+        start = time.perf_counter()
+        writer.write(b'SELECT\n')
+        await writer.drain()
+        arm = int(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        reward, _ = env.pull_arm(arm)
+        writer.write(b'OBSERVE %d %f\n' % (arm, reward))
+        await writer.drain()
+        await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+
+
+def run_clients(path, clients, requests, arms, dist_type, seed, stream):
+    """
+    Runs concurrent simulated clients in one client process, on an event loop of its own
+    :param path: path of the socket
+    :param clients: Number of connections of this process
+    :param requests: Number of decisions per client
+    :param arms: Number of arms
+    :param dist_type: Reward distribution of the simulated problem
+    :param seed: Seed of the simulated problem, the same in all processes
+    :param stream: SeedSequence for the rewards drawn by this process
+    :returns select round trip times in seconds, and the times of the first request and of the last answer
+    """
+    env = Problem(arms, dist_type=dist_type, rng=np.random.default_rng(seed))
+    env.rng = np.random.default_rng(stream)
+    latencies = []
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(load_client(path, env, requests, latencies) for _ in range(clients)))
+        return start, time.perf_counter()
+
+    start, end = asyncio.run(run())
+    return latencies, start, end
+
+
+async def load_test(service, clients=32, requests=1000, seed=None, processes=None):
+    """
+    Load generator: serves the service on a temporary Unix socket and runs concurrent clients against it from
+    separate processes, so the client work does not run on the event loop of the server. Besides the round trip
+    times seen by the clients, the server-side time of every select is measured.
+    :param service: the PolicyService
+    :param clients: Number of concurrent connections
+    :param requests: Number of decisions per client
+    :param seed: Seed of the simulated problem
+    :param processes: Number of client processes (one per core by default, at most one per client)
+    :returns dict with throughput, and round trip and server-side select latency percentiles in milliseconds
+    """
+    processes = max(min(processes or os.cpu_count(), clients), 1)
+    shares = [clients // processes + (i < clients % processes) for i in range(processes)]
+    streams = np.random.SeedSequence(seed).spawn(processes)
+    env = service.agent.env
+    timings = []
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(max_workers=processes) as executor:
+        path = os.path.join(directory, 'bandit.sock')
+        await service.start()
+        server = await serve(service, path, timings)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, run_clients, path, share, requests, env.arms, env.dist_type, seed, stream)
+            for share, stream in zip(shares, streams)))
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+
+    latencies = np.concatenate([result[0] for result in results]) * 1000
+    timings = np.array(timings) * 1000
+    elapsed = max(result[2] for result in results) - min(result[1] for result in results)
+    return {
+        'decisions': len(latencies),
+        'decisions_per_sec': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        'server_p50_ms': float(np.percentile(timings, 50)),
+        'server_p99_ms': float(np.percentile(timings, 99)),
+        'server_max_ms': float(timings.max()),
+        'observations': service.observations,
+    }
+
+
+def main():
+    """
+    Runs the load generator against a local service and prints the throughput and latencies
+    """
+    parser = argparse.ArgumentParser(description="Load test of the online decision service over a Unix socket.")
+    parser.add_argument('--mode', choices=[mode.name for mode in Mode], default=Mode.EPSILON_GREEDY.name)
+    parser.add_argument('--dist', choices=[dist.name for dist in Dist], default=Dist.GAUSS.name,
+                        help="kind of rewards, BERNOULLI for 0/1 rewards")
+    parser.add_argument('--arms', type=int, default=7)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000, help="decisions per client")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--processes', type=int, default=None, help="client processes (one per core by default)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    service = PolicyService(args.arms, mode=Mode[args.mode], dist_type=Dist[args.dist], batch_size=args.batch_size)
+    stats = asyncio.run(load_test(service, clients=args.clients, requests=args.requests, seed=args.seed,
+                                  processes=args.processes))
+    for name, value in stats.items():
+        print("{}:\t{}".format(name, round(value, 4)))
+
+
+if __name__ == "__main__":
+    main()
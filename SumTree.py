@@ -0,0 +1,146 @@
+import math
+
+# a SoftmaxTree is rebuilt with a new shift once a weight leaves the range e^-LIMIT - e^LIMIT
+LIMIT = 50
+
+
+class SumTree:
+    __slots__ = ('arms', 'size', 'tree')
+
+    def __init__(self, weights):
+        """
+        Binary tree over non-negative weights in which every node holds the sum of its children. Changing one weight
+        and drawing an index proportionally to the weights both take O(log k).
+        :param weights: Unnormalized weight per index
+        """
+        self.arms = len(weights)
+        self.size = 1  # number of leaves, smallest power of 2 that fits all weights
+        while self.size < self.arms:
+            self.size *= 2
+        self.tree = [0.0] * (2 * self.size)
+        self.rebuild(weights)
+
+    def rebuild(self, weights):
+        """
+        Replaces all weights in O(k)
+        :param weights: Unnormalized weight per index
+        """
+        tree = self.tree
+        tree[self.size:self.size + self.arms] = [float(w) for w in weights]
+        for i in range(self.size - 1, 0, -1):
+            tree[i] = tree[2 * i] + tree[2 * i + 1]
+
+    def update(self, i, weight):
+        """
+        Changes one weight, the sums on the path to the root are recomputed from their children so rounding errors
+        do not accumulate
+        :param i: Index
+        :param weight: New unnormalized weight
+        """
+        tree = self.tree
+        i += self.size
+        tree[i] = weight
+        i //= 2
+        while i:
+            tree[i] = tree[2 * i] + tree[2 * i + 1]
+            i //= 2
+
+    def weight(self, i):
+        """
+        :param i: Index
+        :returns weight of the index
+        """
+        return self.tree[self.size + i]
+
+    def total(self):
+        """
+        :returns sum of all weights
+        """
+        return self.tree[1]
+
+    def find(self, z):
+        """
+        Finds the index at which the cumulative weight exceeds z
+        :param z: value in [0, total)
+        :returns the index
+        """
+        tree = self.tree
+        i = 1
+        while i < self.size:
+            left = tree[2 * i]
+            if z < left:
+                i = 2 * i
+            else:
+                z -= left
+                i = 2 * i + 1
+        return min(i - self.size, self.arms - 1)
+
+
+class SoftmaxTree:
+    __slots__ = ('logits', 'shift', 'weights')
+
+    def __init__(self, logits):
+        """
+        Softmax distribution over logits, for softmax (logits Qt(a) / tau) and action preferences (logits Ht(a)).
+        The weights exp(logit - shift) are kept in a SumTree, so changing one logit and sampling take O(log k). The
+        shift is a past maximum of the logits and is only renewed, in O(k), when a weight gets close to overflowing
+        or underflowing.
+        :param logits: logit per arm
+        """
+        self.logits = [float(x) for x in logits]
+        self.shift = 0
+        self.weights = SumTree([0.0] * len(self.logits))
+        self.rebuild()
+
+    def rebuild(self, logits=None, shift=None):
+        """
+        Recomputes all weights with the current maximum logit as shift
+        :param logits: New logit per arm (None to keep the current ones)
+        :param shift: Shift to use instead of the maximum logit, e.g. to restore a saved tree exactly
+        """
+        if logits is not None:
+            self.logits = [float(x) for x in logits]
+        self.shift = max(self.logits) if shift is None else shift
+        self.weights.rebuild([math.exp(x - self.shift) for x in self.logits])
+
+    def update(self, i, logit):
+        """
+        Changes the logit of one arm
+        :param i: Arm
+        :param logit: New logit
+        """
+        self.logits[i] = logit
+        if logit - self.shift > LIMIT:
+            self.rebuild()
+        else:
+            self.weights.update(i, math.exp(logit - self.shift))
+            if self.weights.total() < math.exp(-LIMIT):
+                self.rebuild()
+
+    def log_normalizer(self):
+        """
+        :returns log of the sum of exp(logit) over all arms
+        """
+        return self.shift + math.log(self.weights.total())
+
+    def probability(self, i):
+        """
+        :param i: Arm
+        :returns normalized probability of the arm
+        """
+        return self.weights.weight(i) / self.weights.total()
+
+    def probabilities(self):
+        """
+        :returns normalized probability of every arm, O(k)
+        """
+        total = self.weights.total()
+        return [self.weights.weight(i) / total for i in range(len(self.logits))]
+
+    def sample(self, z):
+        """
+        Draws an arm
+        :param z: uniform random value in [0, 1)
+        :returns the arm
+        """
+        return self.weights.find(z * self.weights.total())
@@ -0,0 +1,156 @@
+import itertools
+import math
+
+import numpy as np
+
+from Aggregator import Aggregator
+from Problem import Dist
+from Runner import make_units, run_sequential, run_units
+
+
+def grid_search(**values):
+    """
+    Builds every combination of the given hyperparameter values
+    :param values: list of values per Agent constructor parameter, e.g. epsilon=[0.1, 0.2], ucb_c=[0.5]
+    :returns list of parameter dicts
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def random_search(num, seed=None, **ranges):
+    """
+    Samples hyperparameter combinations uniformly at random
+    :param num: Number of combinations
+    :param seed: Seed for the samples (None for fresh entropy)
+    :param ranges: (low, high) range per Agent constructor parameter, e.g. alpha=(0, 1)
+    :returns list of parameter dicts
+    """
+    rng = np.random.default_rng(seed)
+    samples = {name: rng.uniform(low, high, size=num) for name, (low, high) in ranges.items()}
+    return [{name: float(samples[name][i]) for name in ranges} for i in range(num)]
+
+
+class Candidate:
+    def __init__(self, params, steps, seed):
+        """
+        Running results of one hyperparameter configuration during a sweep
+        :param params: Agent constructor parameters
+        :param steps: Number of time steps per replica
+        :param seed: SeedSequence from which the shards of this candidate are spawned
+        """
+        self.params = params
+        self.seed = seed
+        self.rewards = Aggregator(steps)  # average reward curves
+        self.accuracies = Aggregator(steps)  # accuracy curves
+        self.scores = Aggregator(())  # average reward over all time steps per replica
+        self.rounds = 0  # number of rounds survived
+
+    @property
+    def num(self):
+        """
+        Number of replicas run so far
+        """
+        return self.scores.count
+
+    def add(self, partials):
+        """
+        Folds the shard results of one round into the running results
+        :param partials: shard results as returned by Runner.run_shard
+        """
+        for reward_stats, accuracy_stats, score_stats, _ in partials:
+            self.rewards.merge(reward_stats)
+            self.accuracies.merge(accuracy_stats)
+            self.scores.merge(score_stats)
+        self.rounds += 1
+
+    def mean(self):
+        """
+        :returns mean score (average reward over all time steps) over all replicas so far
+        """
+        return float(self.scores.mean)
+
+    def ci(self):
+        """
+        :returns half width of the 95% confidence interval of the mean score
+        """
+        return float(self.scores.ci()) if self.num > 1 else math.inf
+
+
+def successive_halving(mode, candidates, dist_type=Dist.GAUSS, k=7, steps=1000, min_num=50, max_num=800, eta=2,
+                       seed=None, workers=None):
+    """
+    Tunes the hyperparameters of one algorithm with successive halving. Every round runs a batch of new replicas for
+    all remaining candidates, ranks them on their mean average reward, and only keeps the best 1 / eta of them. The
+    batch size grows by a factor eta per round, so the survivors are compared with more and more replicas.
+    :param mode: Mode for which params are tuned
+    :param candidates: list of parameter dicts, e.g. from grid_search or random_search
+    :param dist_type: Distribution to use
+    :param k: Number of arms
+    :param steps: Number of time steps per replica
+    :param min_num: Number of replicas per candidate in the first round
+    :param max_num: Max number of replicas per candidate over all rounds
+    :param eta: Fraction of candidates that is dropped per round is 1 - 1 / eta
+    :param seed: Master seed of the sweep (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default)
+    :returns list of Candidate, best first, ranked by number of rounds survived and then by mean score
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(candidates))
+    candidates = [Candidate(params, steps, s) for params, s in zip(candidates, seeds)]
+
+    alive = candidates
+    num = min_num
+    while True:
+        num = min(num, max_num - alive[0].num)
+        configs = [(mode, candidate.params) for candidate in alive]
+        units = make_units(configs, dist_type, k, num, steps, [candidate.seed for candidate in alive])
+        for candidate, partials in zip(alive, run_units(units, workers)):
+            candidate.add(partials)
+
+        alive.sort(key=Candidate.mean, reverse=True)
+        if len(alive) == 1 or alive[0].num >= max_num:
+            break
+        alive = alive[:math.ceil(len(alive) / eta)]
+        num *= eta
+
+    return sorted(candidates, key=lambda candidate: (candidate.rounds, candidate.mean()), reverse=True)
+
+
+def sequential_search(mode, candidates, dist_type=Dist.GAUSS, k=7, steps=1000, tolerance=0.005, batch=50,
+                      max_num=800, seed=None, workers=None):
+    """
+    Evaluates every candidate with sequential stopping (Runner.run_sequential): candidates get more replicas only
+    until the confidence intervals of their results are within the tolerance, so clearly good or bad values are
+    settled early and only close ones run up to max_num replicas.
+    :param mode: Mode for which params are tuned
+    :param candidates: list of parameter dicts, e.g. from grid_search or random_search
+    :param dist_type: Distribution to use
+    :param k: Number of arms
+    :param steps: Number of time steps per replica
+    :param tolerance: Max half width of the 95% confidence intervals
+    :param batch: Number of replicas per candidate and round
+    :param max_num: Max number of replicas per candidate
+    :param seed: Master seed of the sweep (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default)
+    :returns list of Candidate, best first, ranked by mean score
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(candidates))
+    candidates = [Candidate(params, steps, s) for params, s in zip(candidates, seeds)]
+    results = run_sequential([(mode, candidate.params) for candidate in candidates], dist_type=dist_type, k=k,
+                             steps=steps, tolerance=tolerance, batch=batch, max_num=max_num, workers=workers,
+                             seeds=[candidate.seed for candidate in candidates])
+    for candidate, (rewards, accuracies, scores, _) in zip(candidates, results):
+        candidate.rewards, candidate.accuracies, candidate.scores = rewards, accuracies, scores
+        candidate.rounds = math.ceil(scores.count / batch)
+    return sorted(candidates, key=Candidate.mean, reverse=True)
+
+
+def print_sweep(candidates):
+    """
+    Prints the results of a sweep, one line per candidate
+    :param candidates: list of Candidate as returned by successive_halving
+    """
+    for candidate in candidates:
+        params = ", ".join("{}={}".format(name, round(value, 3)) for name, value in candidate.params.items())
+        print("{}:\t{} +- {}\t({} runs)".format(params, round(candidate.mean(), 4), round(candidate.ci(), 4),
+                                               candidate.num))
@@ -0,0 +1,191 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Agent import Agent, Mode
+from BatchAgent import BatchAgent
+from BatchProblem import BatchProblem
+import Kernel
+from Problem import Problem, Dist
+from Runner import run_experiment
+
+ENGINES = ['scalar', 'kernel', 'batch', 'parallel']
+QUICK = {'arms': [7, 100], 'horizons': [1000]}
+FULL = {'arms': [7, 100, 10000], 'horizons': [1000, 10000, 100000, 1000000]}
+
+# min seconds per timed repetition, short workloads are looped until they take this long
+MIN_TIME = 0.2
+
+
+def peak_memory_mb(who=resource.RUSAGE_SELF):
+    """
+    :param who: RUSAGE_SELF for this process, RUSAGE_CHILDREN for the largest finished child process
+    :returns peak resident memory in MB
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_workload(case):
+    """
+    Runs the workload of one benchmark case once
+    :param case: benchmark case
+    """
+    mode, dist_type = Mode[case['mode']], Dist[case['dist']]
+    k, horizon, replicas = case['k'], case['horizon'], case['replicas']
+    match case['engine']:
+        case 'scalar':
+            for _ in range(replicas):
+                Agent(Problem(k, dist_type=dist_type), mode=mode).run(max_steps=horizon)
+        case 'kernel':  # Agent.run without numba
+            for _ in range(replicas):
+                Kernel.run(Agent(Problem(k, dist_type=dist_type), mode=mode), max_steps=horizon)
+        case 'batch':
+            rng = np.random.default_rng(0)
+            env = BatchProblem(replicas, k, dist_type=dist_type, rng=rng)
+            BatchAgent(env, mode=mode, rng=rng).run(max_steps=horizon, record=False)
+        case 'parallel':
+            run_experiment([(mode, {})], dist_type=dist_type, k=k, num=replicas, steps=horizon, seed=0,
+                           workers=case['workers'])
+
+
+def run_case(case):
+    """
+    Runs one benchmark case. Called in a fresh process, so the peak memory only belongs to this case. The workload
+    is run once untimed, then timed case['repeats'] times; workloads shorter than MIN_TIME are looped within every
+    repetition, so even one short scalar run is long enough to measure. The best repetition is reported, as it is
+    the one least disturbed by other load on the machine.
+    :param case: dict with engine, mode, dist, k, horizon, replicas, workers and repeats
+    :returns the case with wall time per workload (best and median), throughput in agent-steps per second (of the
+    best repetition) and peak memory (growth of this process during the runs) added
+    """
+    if case['engine'] == 'kernel':  # compiles the kernel or loads it from the cache, outside of the timing
+        Kernel.run(Agent(Problem(2, dist_type=Dist[case['dist']]), mode=Mode[case['mode']]), max_steps=5)
+    baseline_memory = peak_memory_mb()
+
+    start = time.perf_counter()
+    run_workload(case)
+    loops = max(math.ceil(MIN_TIME / (time.perf_counter() - start)), 1)
+    wall_times = []
+    for _ in range(case['repeats']):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run_workload(case)
+        wall_times.append((time.perf_counter() - start) / loops)
+
+    result = dict(case)
+    result['loops'] = loops
+    result['wall_time'] = min(wall_times)
+    result['median_wall_time'] = float(np.median(wall_times))
+    result['steps_per_sec'] = case['replicas'] * case['horizon'] / result['wall_time']
+    result['peak_memory_mb'] = max(peak_memory_mb() - baseline_memory, 0)
+    result['worker_peak_memory_mb'] = peak_memory_mb(resource.RUSAGE_CHILDREN)  # parallel engine only
+    return result
+
+
+def case_name(case):
+    """
+    :param case: benchmark case
+    :returns name identifying the case, used to match results with the baseline
+    """
+    return "{engine}/{mode}/{dist}/k={k}/T={horizon}/N={replicas}".format(**case)
+
+
+def make_cases(engines, modes, dists, arms, horizons, replicas, scalar_replicas, workers, repeats=5):
+    """
+    Builds the benchmark grid
+    :returns list of benchmark cases
+    """
+    cases = []
+    for engine, mode, dist_type, k, horizon in itertools.product(engines, modes, dists, arms, horizons):
+        cases.append({'engine': engine, 'mode': mode.name, 'dist': dist_type.name, 'k': k, 'horizon': horizon,
+                      'replicas': scalar_replicas if engine in ('scalar', 'kernel') else replicas, 'workers': workers,
+                      'repeats': repeats})
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline
+    :param results: list of benchmark results
+    :param baseline: list of benchmark results of the baseline
+    :param tolerance: allowed relative loss in throughput or growth in peak memory
+    :returns list of regression messages
+    """
+    baseline = {case_name(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(case_name(result))
+        if old is None:
+            continue
+        if result['steps_per_sec'] < old['steps_per_sec'] * (1 - tolerance):
+            regressions.append("{}: {:.0f} steps/s, baseline {:.0f}".format(
+                case_name(result), result['steps_per_sec'], old['steps_per_sec']))
+        if result['peak_memory_mb'] > old['peak_memory_mb'] * (1 + tolerance) + 1:
+            regressions.append("{}: {:.1f} MB peak memory, baseline {:.1f}".format(
+                case_name(result), result['peak_memory_mb'], old['peak_memory_mb']))
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark grid, writes the results as JSON and compares them with a stored baseline
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks agent throughput per engine, mode, distribution, "
+                                                 "number of arms and horizon.")
+    parser.add_argument('--full', action='store_true', help="k in {7, 100, 10000} and horizons up to 10^6")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--modes', nargs='+', choices=[mode.name for mode in Mode], default=None)
+    parser.add_argument('--dists', nargs='+', choices=[dist_type.name for dist_type in Dist], default=None)
+    parser.add_argument('--arms', nargs='+', type=int, help="numbers of arms, overrides the grid")
+    parser.add_argument('--horizons', nargs='+', type=int, help="numbers of time steps, overrides the grid")
+    parser.add_argument('--replicas', type=int, default=1000, help="replicas for the batch and parallel engines")
+    parser.add_argument('--scalar-replicas', type=int, default=1, help="replicas for the scalar and kernel engines")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="workers for the parallel engine")
+    parser.add_argument('--repeats', type=int, default=5, help="timed repetitions per case, the best one counts")
+    parser.add_argument('--output', default='bench_results.json', help="file the JSON results are written to")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    grid = FULL if args.full else QUICK
+    modes = [Mode[name] for name in args.modes] if args.modes else list(Mode)
+    dists = [Dist[name] for name in args.dists] if args.dists else list(Dist)
+    cases = make_cases(args.engines, modes, dists, args.arms or grid['arms'], args.horizons or grid['horizons'],
+                       args.replicas, args.scalar_replicas, args.workers, args.repeats)
+
+    results = []
+    for case in cases:
+        # every case runs in a new process, so peak memory is not shared between cases
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_case, case).result()
+        results.append(result)
+        print("{:<60} {:>14.0f} steps/s {:>10.3f} s {:>9.1f} MB".format(
+            case_name(result), result['steps_per_sec'], result['wall_time'], result['peak_memory_mb']))
+
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'cpu_count': os.cpu_count(), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
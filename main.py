@@ -1,182 +1,222 @@
+import argparse
 import os
 from Agent import *
-from matplotlib import pyplot as plt
-from Problem import Problem, Dist
+from Cache import ResultCache
+from Plot import render_all, save_figure
+from Problem import Dist
+from Runner import run_experiment, run_paired, run_sequential
+from Sweep import grid_search, print_sweep, sequential_search, successive_halving
+
+# tunable hyperparameter of every algorithm that has one, with the range of values that is searched
+TUNING = {
+    Mode.EPSILON_GREEDY: ('epsilon', 0, 1),
+    Mode.SOFTMAX: ('tau', 0, 1),
+    Mode.ACTION_PREFERENCES: ('alpha', 0, 1),
+    Mode.UCB: ('ucb_c', 0, 1),
+    Mode.DISCOUNTED_UCB: ('gamma', 0.9, 0.999),
+    Mode.SW_UCB: ('window', 10, 1000),
+}
+
+
+def count_runs(counts, labels):
+    """
+    Puts the actual numbers of runs in a figure: in the title if all curves have the same number, otherwise in the
+    label of every curve, as sequential stopping and successive halving give curves different numbers of runs
+    :param counts: Number of runs per curve
+    :param labels: Label per curve
+    :returns the title suffix and the labels
+    """
+    if len(set(counts)) == 1:
+        return " over " + str(counts[0]) + " runs", labels
+    return "", ["{} ({} runs)".format(label, count) for label, count in zip(labels, counts)]
 
 
-def plot_average(avg_rewards, dist_type, num, plot_acc):
+def plot_average(avg_rewards, dist_type, counts, plot_acc, labels, cis=None):
     """
-    Plots a graph for the average performance of multiple agents per distribution.
+    Stores the graph for the average performance of multiple agents per distribution, to be rendered with Plot.
     :param plot_acc: If True, plots the average accuracy w.r.t best action. Otherwise plots the average reward
-    :param num: Number of iterations
+    :param counts: Number of runs per agent
     :param avg_rewards: List of average rewards over time per agent.
     :param dist_type: Distribution type
+    :param labels: Label per agent
+    :param cis: Optional half widths of the confidence intervals over time per agent, drawn as bands
+    :returns path of the stored figure
     """
-    fig = plt.figure(figsize=(10, 8))
-    for i in range(len(avg_rewards)):
-        label = Mode(i).name
-        plt.plot(avg_rewards[i], label=label)
-    plt.legend(loc='upper right')
+    runs, labels = count_runs(counts, labels)
     if not plot_acc:
-        plt.xlabel("Time-step")
-        plt.ylabel("Average Reward")
-        plt.title("Average reward over " + str(num) + " runs for the " + dist_type.name.title() + " distribution")
-        plt.show()
-        fname = os.getcwd() + '/plots/avg/' + dist_type.name + '.png'
-        fig.savefig(fname)
+        ylabel = "Average Reward"
+        title = "Average reward" + runs + " for the " + dist_type.name.title() + " distribution"
+        fname = os.getcwd() + '/plots/avg/' + dist_type.name + '.npz'
     else:
-        plt.xlabel("Time-step")
-        plt.ylabel("Arm accuracy")
-        plt.title("Average accuracy over " + str(num) + " runs for the " + dist_type.name.title() + " distribution")
-        plt.show()
-        fname = os.getcwd() + '/plots/acc/' + dist_type.name + '.png'
-        fig.savefig(fname)
+        ylabel = "Arm accuracy"
+        title = "Average accuracy" + runs + " for the " + dist_type.name.title() + " distribution"
+        fname = os.getcwd() + '/plots/acc/' + dist_type.name + '.npz'
+    save_figure(fname, title, "Time-step", ylabel, labels, avg_rewards, cis)
+    return fname
 
 
-def run_and_plot_avg(dist_type=Dist.GAUSS, k=7, num=1000):
+def run_and_plot_avg(dist_type=Dist.GAUSS, k=7, num=1000, seed=None, workers=None, cache=None, crn=False,
+                     tolerance=None, steps=1000, plot=True):
     """
     Runs and plots the average results of multiple agents for every algorithm, on a certain distribution.
     :param dist_type: Reward distribution type
     :param k: Number of arms
-    :param num: Number of agents
+    :param num: Number of agents (max number with a tolerance)
+    :param seed: Master seed for the experiment (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default)
+    :param cache: Optional ResultCache, cached modes are not run again
+    :param crn: If True, all modes run on the same problems and reward streams, and the final average reward of every
+    mode is printed as a paired difference with the first mode
+    :param tolerance: If set, every mode stops as soon as the 95% confidence intervals of its final and
+    area-under-curve average reward and accuracy are narrower than +- tolerance, and the number of agents per mode
+    is printed
+    :param steps: Number of time steps per agent
+    :param plot: If False, the figures are only stored and can be rendered later with the plot command
+    :returns paths of the stored figures
     """
-    avg_rewards = []  # contains average rewards over all agents per mo
-    accuracies = []
-    for mode in Mode:
-        rewards = None
-        selections = None
-        for _ in range(num):
-            # initialize bandit problem
-            env = Problem(k, dist_type=dist_type)
-
-            # initialize agent using optimal parameters based on hyperparameter tuning
-            agent = Agent(env, mode=mode, epsilon=.38, ucb_c=0.38, alpha=.9, tau=0.12)
-
-            # run agent and update rewards/selection
-            agent.run(verbose=False, max_steps=1000)
-            if rewards is None:
-                rewards = agent.average_rewards
-            else:
-                rewards = np.add(rewards, agent.average_rewards)
-            if selections is None:
-                selections = agent.accuracy
-            else:
-                selections = np.add(selections, agent.accuracy)
-        # get average selection/reward
-        rewards = [x / num for x in rewards]
-        selections = [x / num for x in selections]
-        avg_rewards.append(rewards)
-        accuracies.append(selections)
-        print(mode.name, 'complete!')
+    # initialize agents using optimal parameters based on hyperparameter tuning
+    params = {'epsilon': .38, 'ucb_c': 0.38, 'alpha': .9, 'tau': 0.12}
+    configs = [(mode, params) for mode in Mode]
+
+    # run agents and get average selection/reward per mode
+    if crn:
+        results = run_paired(configs, dist_type=dist_type, k=k, num=num, steps=steps, seed=seed, workers=workers)
+        for (mode, _), (_, _, differences) in zip(configs, results):
+            print("{} - {}:\t{} +- {}".format(mode.name, configs[0][0].name, round(differences.mean[-1], 4),
+                                              round(differences.ci()[-1], 4)))
+    elif tolerance is not None:
+        results = run_sequential(configs, dist_type=dist_type, k=k, steps=steps, tolerance=tolerance, max_num=num,
+                                 seed=seed, workers=workers)
+        for (mode, _), result in zip(configs, results):
+            print("{}:\t{} runs".format(mode.name, result[0].count))
+    else:
+        results = run_experiment(configs, dist_type=dist_type, k=k, num=num, steps=steps, seed=seed, workers=workers,
+                                 cache=cache)
+    avg_rewards = [result[0].mean for result in results]  # contains average rewards over all agents per mode
+    accuracies = [result[1].mean for result in results]
+    labels = [mode.name for mode, _ in configs]
+    counts = [result[0].count for result in results]
 
     # plot performance
-    plot_average(avg_rewards, dist_type, num, False)
-    plot_average(accuracies, dist_type, num, True)
+    figures = [plot_average(avg_rewards, dist_type, counts, False, labels, [result[0].ci() for result in results]),
+               plot_average(accuracies, dist_type, counts, True, labels, [result[1].ci() for result in results])]
+    if plot:
+        render_all(figures, workers=workers)
+    return figures
 
 
-def plot_hyperparameter(avg_rewards, mode, num, tune_space):
+def plot_hyperparameter(avg_rewards, mode, counts, tune_space, cis=None):
     """
-    Plots a graph for the average performance of multiple agents for one distribution.
+    Stores the graph for the average performance of multiple agents for one distribution, to be rendered with Plot.
     :param tune_space: Values for which agents were trained
     :param mode: Mode for which hyperparameters were tuned
-    :param num: Number of iterations
+    :param counts: Number of runs per value
     :param avg_rewards: List of average rewards over time per agent.
+    :param cis: Optional half widths of the confidence intervals over time per agent, drawn as bands
+    :returns path of the stored figure
     """
-    # create figure and plot
-    fig = plt.figure(figsize=(10, 8))
     # plot hyperparam val for 0.1, 0.2, ..
-    i = 0
-    for value in tune_space:
-        plt.plot(avg_rewards[i], label=round(value, 2))
-        i += 1
-    plt.legend(loc='upper right')
-    plt.xlabel("Time-step")
-    plt.ylabel("Average Reward")
-    plt.title("Tuning of parameters for " + mode.name + " over " + str(num) + " runs")
-    plt.show()
-    # save
-    fname = os.getcwd() + '/plots/tuning/' + mode.name + '.png'
-    fig.savefig(fname)
-
-
-def run_tuning(mode, dist_type, tune_num=10, num=300):
+    runs, labels = count_runs(counts, [round(value, 2) for value in tune_space])
+    title = "Tuning of parameters for " + mode.name + runs
+    fname = os.getcwd() + '/plots/tuning/' + mode.name + '.npz'
+    save_figure(fname, title, "Time-step", "Average Reward", labels, avg_rewards, cis)
+    return fname
+
+
+def run_tuning(mode, dist_type, tune_num=10, num=300, seed=None, workers=None, tolerance=None, steps=1000, plot=True):
     """
-    Tunes hyperparameters and plots results.
+    Tunes hyperparameters with successive halving, or sequential stopping if a tolerance is given, prints the
+    ranking and plots results.
     :param mode: Mode for which params are tuned
     :param dist_type: Distribution to use
     :param tune_num: Number of hyperparameter values
-    :param num: Number of iterations
+    :param num: Max number of iterations per hyperparameter value
+    :param seed: Master seed for the experiment (None for fresh entropy)
+    :param workers: Number of worker processes (all cores by default)
+    :param tolerance: If set, every value gets replicas until the 95% confidence intervals of its results are
+    narrower than +- tolerance (at most num)
+    :param steps: Number of time steps per agent
+    :param plot: If False, the figure is only stored and can be rendered later with the plot command
+    :returns path of the stored figure
     """
-    # get hyperparameter tuning values
-    tune_space = np.linspace(0, 1, num=tune_num, endpoint=True)
-
-    rewards = None
-    avg_rewards = []
-
-    match mode:  # matches correct algorithm, each one is a copy paste for a different parameter
-        case Mode.EPSILON_GREEDY:
-            for val in tune_space:
-                for _ in range(num):
-                    env = Problem(7, dist_type=dist_type, verbose=False)
-                    agent = Agent(env, mode=mode, epsilon=val)
-                    agent.run(verbose=False, max_steps=1000)
-                    if rewards is None:
-                        rewards = agent.average_rewards
-                    else:
-                        rewards = np.add(rewards, agent.average_rewards)
-                rewards = [x / num for x in rewards]
-                avg_rewards.append(rewards)
-        case Mode.SOFTMAX:
-            for val in tune_space:
-                for _ in range(num):
-                    env = Problem(7, dist_type=dist_type, verbose=False)
-                    agent = Agent(env, mode=mode, tau=val)
-                    agent.run(verbose=False, max_steps=1000)
-                    if rewards is None:
-                        rewards = agent.average_rewards
-                    else:
-                        rewards = np.add(rewards, agent.average_rewards)
-                rewards = [x / num for x in rewards]
-                avg_rewards.append(rewards)
-        case Mode.ACTION_PREFERENCES:
-            for val in tune_space:
-                for _ in range(num):
-                    env = Problem(7, dist_type=dist_type, verbose=False)
-                    agent = Agent(env, mode=mode, alpha=val)
-                    agent.run(verbose=False, max_steps=1000)
-                    if rewards is None:
-                        rewards = agent.average_rewards
-                    else:
-                        rewards = np.add(rewards, agent.average_rewards)
-                rewards = [x / num for x in rewards]
-                avg_rewards.append(rewards)
-        case Mode.UCB:
-            for val in tune_space:
-                for _ in range(num):
-                    env = Problem(7, dist_type=dist_type, verbose=False)
-                    agent = Agent(env, mode=mode, ucb_c=val)
-                    agent.run(verbose=False, max_steps=1000)
-                    if rewards is None:
-                        rewards = agent.average_rewards
-                    else:
-                        rewards = np.add(rewards, agent.average_rewards)
-                rewards = [x / num for x in rewards]
-                avg_rewards.append(rewards)
-        case _:
-            print("Invalid algorithm!")
-
-    # plot hyperparameter graph
-    plot_hyperparameter(avg_rewards, mode, num, tune_space)
+    if mode not in TUNING:
+        print("Invalid algorithm!")
+        return None
+    parameter, low, high = TUNING[mode]  # the hyperparameter of the algorithm
+
+    # get hyperparameter tuning values, weak values are dropped after a fraction of the runs
+    values = np.linspace(low, high, num=tune_num, endpoint=True).tolist()
+    if parameter == 'window':  # window sizes are whole numbers of steps
+        values = sorted(set(int(round(value)) for value in values))
+    candidates = grid_search(**{parameter: values})
+    if tolerance is not None:
+        results = sequential_search(mode, candidates, dist_type=dist_type, k=7, steps=steps, tolerance=tolerance,
+                                    max_num=num, seed=seed, workers=workers)
+    else:
+        results = successive_halving(mode, candidates, dist_type=dist_type, k=7, steps=steps,
+                                     min_num=max(num // 8, 1), max_num=num, seed=seed, workers=workers)
+    print_sweep(results)
+
+    # plot hyperparameter graph, best value first
+    tune_space = [candidate.params[parameter] for candidate in results]
+    avg_rewards = [candidate.rewards.mean for candidate in results]
+    cis = [candidate.rewards.ci() for candidate in results]
+    counts = [candidate.num for candidate in results]
+    figure = plot_hyperparameter(avg_rewards, mode, counts, tune_space, cis)
+    if plot:
+        render_all([figure], workers=1)
+    return figure
 
 
 def main():
     """
-    Runs the multi-armed bandit problem for the given distribution with k arms, num iterations, and plots the results
+    Command line interface. "run" runs all algorithms for the given distribution with k arms and num iterations,
+    "tune" tunes the hyperparameter of one algorithm, and "plot" renders stored figures again. Without a command,
+    the Bernoulli distribution is run with 7 arms and 1000 iterations. Figures are rendered headless, so the
+    commands also work without a display.
     """
-    dist_type = Dist.BERNOULLI  # dist to use for plotting
-    k = 7  # number of arms
-    num = 1000  # number of problem iterations
-    run_and_plot_avg(dist_type, k, num)
+    parser = argparse.ArgumentParser(description="Multi-armed bandit experiments.")
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', help="run and plot the average results of all algorithms")
+    run.add_argument('--dist', choices=[dist.name for dist in Dist], default=Dist.BERNOULLI.name)
+    run.add_argument('--arms', type=int, default=7, help="number of arms")
+    run.add_argument('--num', type=int, default=1000, help="number of problem iterations")
+    run.add_argument('--crn', action='store_true', help="compare all algorithms on the same reward streams")
+    tune = commands.add_parser('tune', help="tune the hyperparameter of one algorithm")
+    tune.add_argument('mode', choices=[mode.name for mode in TUNING])
+    tune.add_argument('--dist', choices=[dist.name for dist in Dist], default=Dist.GAUSS.name)
+    tune.add_argument('--values', type=int, default=10, help="number of hyperparameter values")
+    tune.add_argument('--num', type=int, default=300, help="max number of problem iterations per value")
+    for command in (run, tune):
+        command.add_argument('--steps', type=int, default=1000, help="time steps per iteration")
+        command.add_argument('--seed', type=int, default=0, help="master seed, results are reproducible for a seed")
+        command.add_argument('--workers', type=int, default=None, help="worker processes (all cores by default)")
+        command.add_argument('--tolerance', type=float, default=None,
+                             help="stop every algorithm once its 95%% confidence intervals are this narrow")
+        command.add_argument('--no-plot', action='store_true', help="only store the figure data")
+    plot = commands.add_parser('plot', help="render stored figures")
+    plot.add_argument('figures', nargs='+', help=".npz files stored by run or tune")
+    plot.add_argument('--no-bands', action='store_true', help="leave out the confidence bands")
+    plot.add_argument('--width', type=int, default=2000, help="max number of points per curve")
+    plot.add_argument('--workers', type=int, default=None, help="worker processes (all cores by default)")
+    args = parser.parse_args()
+
+    match args.command:
+        case 'run' | None:
+            if args.command is None:
+                args = run.parse_args([])
+            cache = ResultCache('results')  # finished results are stored here and not computed again
+            figures = run_and_plot_avg(Dist[args.dist], args.arms, args.num, args.seed, workers=args.workers,
+                                       cache=cache, crn=args.crn, tolerance=args.tolerance, steps=args.steps,
+                                       plot=not args.no_plot)
+            print("Figures:", *figures)
+        case 'tune':
+            figure = run_tuning(Mode[args.mode], Dist[args.dist], args.values, args.num, args.seed, args.workers,
+                                tolerance=args.tolerance, steps=args.steps, plot=not args.no_plot)
+            print("Figure:", figure)
+        case 'plot':
+            for image in render_all(args.figures, bands=not args.no_bands, width=args.width, workers=args.workers):
+                print(image)
 
 
 if __name__ == "__main__":